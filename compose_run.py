@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Compose a new inference run from outputs computed in earlier runs.
+
+For every (video, model) pair, copies an existing <video>_<model>.json from an
+older output/run_* directory when the model, prompt, generation profile and
+output settings (proxy, media resolution, structured output, candidates,
+chunking) match, then leaves only
+the missing pairs pending so `run_inference.py --resume` sends just those to
+Vertex.
+"""
+
+import sys
+import json
+import argparse
+import subprocess
+from pathlib import Path
+from typing import List, Dict, Any, Tuple
+
+from run_inference import (
+    BASE_OUTPUT_DIR,
+    MANIFEST_FILE,
+    OUTPUT_SETTING_KEYS,
+    RAW_DIR,
+    RUN_CONFIG_FILE,
+    VIDEO_METADATA,
+    TaskManifest,
+    add_model_arguments,
+    build_run_config,
+    create_run_dir,
+    get_prompt,
+    list_videos_from_gcs,
+    prompt_sha256,
+    video_name_from_uri,
+    write_json,
+)
+
+
+def parse_legacy_mapping(values: List[str], defaults: Dict[str, Any]) -> Dict[str, Tuple[str, str, str, tuple]]:
+    """Parse --legacy NAME=MODEL_ID:PROMPT_TYPE declarations (old runs used the default profile and settings)."""
+    mapping = {}
+    for value in values:
+        try:
+            name, spec = value.split("=", 1)
+            model_id, prompt_type = spec.rsplit(":", 1)
+        except ValueError:
+            print(f"ERROR: --legacy expects NAME=MODEL_ID:PROMPT_TYPE, got '{value}'")
+            sys.exit(1)
+        mapping[name] = (model_id, prompt_sha256(get_prompt(prompt_type)), "default", output_settings({}, defaults))
+    return mapping
+
+
+def output_settings(config: Dict[str, Any], defaults: Dict[str, Any]) -> tuple:
+    """The run's output settings, in OUTPUT_SETTING_KEYS order (defaults for runs that predate one)."""
+    return tuple(config.get(key, defaults[key]) for key in OUTPUT_SETTING_KEYS)
+
+
+def load_source_runs(run_dirs: List[Path], legacy_mapping: Dict[str, Tuple[str, str, str, tuple]],
+                     defaults: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Describe which (model_id, prompt hash, profile, output settings) each model name in each earlier run used.
+    
+    Runs with a run_config.json describe themselves. Older runs without one are
+    only used if the caller declared their models with --legacy. Newest runs
+    come first so they win when several runs have the same output.
+    """
+    sources = []
+    for run_dir in sorted(run_dirs, key=lambda p: p.name, reverse=True):
+        if not (run_dir / "json").is_dir():
+            continue
+        
+        config_path = run_dir / RUN_CONFIG_FILE
+        models = {}
+        if config_path.exists():
+            with open(config_path) as f:
+                config = json.load(f)
+            settings = output_settings(config, defaults)
+            for slot in ("model1", "model2"):
+                sha = config.get(f"{slot}_prompt_sha256")
+                if sha:
+                    models[config[f"{slot}_name"]] = (config[slot], sha, config.get(f"{slot}_profile", "default"), settings)
+        else:
+            models = dict(legacy_mapping)
+        
+        if models:
+            # Manifest entries by (video, model name), so lookups don't scan the whole manifest
+            tasks = {}
+            if (run_dir / MANIFEST_FILE).exists():
+                for task in TaskManifest(run_dir).tasks.values():
+                    tasks.setdefault((task["video_uri"], task["model_name"]), task)
+            sources.append({"run_dir": run_dir, "models": models, "tasks": tasks})
+    return sources
+
+
+def find_reusable_output(sources: List[Dict[str, Any]], video_uri: str, model_id: str, sha: str, profile: str,
+                         settings: tuple):
+    """Find a successful earlier output for a video with the same model, prompt, profile and output settings.
+    
+    Returns (path, data) or (None, None). Failed outputs and outputs whose
+    response couldn't be parsed (inference.parse_error) are skipped. If the
+    earlier run recorded the video blob's generation and it differs from the
+    current one, the video has been replaced since and the output is skipped.
+    """
+    video_name = video_name_from_uri(video_uri)
+    current_generation = VIDEO_METADATA.get(video_uri, {}).get("generation")
+    
+    for source in sources:
+        for old_name, old_model in source["models"].items():
+            if old_model != (model_id, sha, profile, settings):
+                continue
+            
+            path = source["run_dir"] / "json" / f"{video_name}_{old_name}.json"
+            if not path.exists():
+                continue
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                continue
+            if "error" in data or data.get("inference", {}).get("parse_error"):
+                continue
+            
+            if current_generation:
+                entry = source["tasks"].get((video_uri, old_name))
+                old_generation = (entry or {}).get("video", {}).get("generation")
+                if old_generation and str(old_generation) != str(current_generation):
+                    continue
+            
+            return path, data
+    return None, None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build a new run directory from earlier outputs; only missing (video, model) pairs are left to infer"
+    )
+    add_model_arguments(parser)
+    parser.add_argument(
+        "--sources",
+        type=str,
+        nargs="*",
+        help=f"Earlier run directories to reuse outputs from. Default: every {BASE_OUTPUT_DIR}/run_*"
+    )
+    parser.add_argument(
+        "--legacy",
+        type=str,
+        action="append",
+        default=[],
+        metavar="NAME=MODEL_ID:PROMPT_TYPE",
+        help="Declare what a model name meant in old runs without run_config.json, "
+             "e.g. baseline=gemini-2.5-pro:numbered (assumes the current prompt text)"
+    )
+    parser.add_argument(
+        "--infer",
+        action="store_true",
+        help="Run inference for the missing pairs right away. Unrecognised arguments are passed to run_inference.py"
+    )
+    args, passthrough = parser.parse_known_args()
+    if passthrough and not args.infer:
+        parser.error(f"unrecognized arguments: {' '.join(passthrough)}")
+    
+    source_dirs = [Path(p) for p in args.sources] if args.sources else sorted(BASE_OUTPUT_DIR.glob("run_*"))
+    defaults = {key: parser.get_default(key) for key in OUTPUT_SETTING_KEYS}
+    sources = load_source_runs(source_dirs, parse_legacy_mapping(args.legacy, defaults), defaults)
+    
+    print("=" * 80)
+    print("Composing Run From Earlier Outputs")
+    print("=" * 80)
+    print(f"Source runs with known models: {len(sources)}")
+    for source in sources:
+        names = ", ".join(
+            f"{name}={model_id}" + (f" [{profile}]" if profile != "default" else "")
+            for name, (model_id, _, profile, _) in source["models"].items()
+        )
+        print(f"  - {source['run_dir'].name}: {names}")
+    print()
+    
+    video_uris = list_videos_from_gcs(args.gcs_path)
+    if not video_uris:
+        print("ERROR: No videos found!")
+        sys.exit(1)
+    
+    run_dir = create_run_dir()
+    run_config = build_run_config(args)
+    write_json(run_dir / RUN_CONFIG_FILE, run_config)
+    manifest = TaskManifest(run_dir)
+    settings = output_settings(run_config, defaults)
+    
+    slots = []
+    for slot in ("model1", "model2"):
+        prompt_type = "none" if getattr(args, f"{slot}_no_prompt") else getattr(args, f"{slot}_prompt")
+        slots.append((
+            getattr(args, slot), getattr(args, f"{slot}_name"), prompt_type,
+            run_config[f"{slot}_prompt_sha256"], getattr(args, f"{slot}_profile"),
+        ))
+    
+    print()
+    print("-" * 80)
+    reused = {name: 0 for _, name, _, _, _ in slots}
+    for video_uri in video_uris:
+        video_name = video_name_from_uri(video_uri)
+        for model_id, model_name, prompt_type, sha, profile in slots:
+            key = manifest.add_task(video_uri, model_name, model_id, prompt_type, VIDEO_METADATA.get(video_uri))
+            source_path, data = find_reusable_output(sources, video_uri, model_id, sha, profile, settings)
+            if source_path is None:
+                continue
+            
+            data.setdefault("inference", {})["reused_from"] = str(source_path)
+            output_path = run_dir / "json" / f"{video_name}_{model_name}.json"
+            write_json(output_path, data)
+            raw_path = source_path.parent.parent / RAW_DIR / source_path.name
+            if raw_path.exists():
+                # Keep the raw responses too, so parse_outputs.py can rebuild this run
+                with open(raw_path) as f:
+                    raw = json.load(f)
+                raw["model_name"] = model_name
+                raw.setdefault("inference", {})["reused_from"] = str(source_path)
+                (run_dir / RAW_DIR).mkdir(exist_ok=True)
+                write_json(run_dir / RAW_DIR / output_path.name, raw)
+            manifest.update(key, "done", output=f"json/{output_path.name}", error=None, reused_from=str(source_path))
+            reused[model_name] += 1
+    
+    missing = len(manifest.unfinished())
+    for model_name, count in reused.items():
+        print(f"  {model_name}: reused {count}/{len(video_uris)} outputs")
+    print(f"  Missing (video, model) pairs to infer: {missing}")
+    
+    print()
+    print("=" * 80)
+    print(f"✓ Composed run: {run_dir}")
+    if missing and not args.infer:
+        print(f"  Next: python run_inference.py --resume {run_dir}")
+    print("=" * 80)
+    
+    if missing and args.infer:
+        cmd = [sys.executable, str(Path(__file__).parent / "run_inference.py"), "--resume", str(run_dir)] + passthrough
+        sys.exit(subprocess.run(cmd).returncode)
+
+
+if __name__ == "__main__":
+    main()
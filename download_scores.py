@@ -1,10 +1,17 @@
 #!/usr/bin/env python3
 """
 Download scores from GCS for local analysis.
+
+The scoring app saves each submission as its own object under
+scores/submissions/; scores saved before that are in scores/scores.csv. Both
+are combined into one local CSV.
 """
 
 import os
+import json
+from io import StringIO
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from google.cloud.storage import Client
 from dotenv import load_dotenv
 
@@ -13,38 +20,63 @@ load_dotenv()
 PROJECT_ID = os.getenv("GCP_PROJECT_ID")
 GCS_BUCKET = "buildai-dataset"
 GCS_SCORES_PATH = "scores/scores.csv"
+GCS_SUBMISSIONS_PATH = "scores/submissions"
 LOCAL_OUTPUT = Path("./output/scores.csv")
 
+SCORE_COLUMNS = [
+    'timestamp', 'rater_id', 'video', 'color', 'model', 'mode',
+    'coverage', 'order', 'verb', 'specificity', 'hallucination', 'score', 'notes'
+]
+
 
 def download_scores():
-    """Download scores CSV from GCS."""
-    print(f"Downloading scores from gs://{GCS_BUCKET}/{GCS_SCORES_PATH}...")
+    """Download all scores from GCS into one CSV."""
+    import pandas as pd
+    
+    print(f"Downloading scores from gs://{GCS_BUCKET}/{GCS_SCORES_PATH} and {GCS_SUBMISSIONS_PATH}/...")
     
     storage_client = Client(project=PROJECT_ID)
     bucket = storage_client.bucket(GCS_BUCKET)
-    blob = bucket.blob(GCS_SCORES_PATH)
     
     try:
+        frames = []
+        blob = bucket.blob(GCS_SCORES_PATH)
+        if blob.exists():
+            frames.append(pd.read_csv(StringIO(blob.download_as_text())))
+            print(f"  Legacy CSV: {len(frames[0])} scores")
+        
+        blobs = list(bucket.list_blobs(prefix=f"{GCS_SUBMISSIONS_PATH}/"))
+        with ThreadPoolExecutor(max_workers=32) as executor:
+            submissions = list(executor.map(lambda b: json.loads(b.download_as_text()), blobs))
+        rows = [row for submission in submissions for row in submission]
+        print(f"  Submissions: {len(blobs)} ({len(rows)} scores)")
+        if rows:
+            frames.append(pd.DataFrame(rows))
+        
+        if not frames:
+            raise FileNotFoundError("no scores found")
+        df = pd.concat(frames, ignore_index=True)
+        # Current columns first; columns only the legacy CSV has (e.g. text_color,
+        # final_score) are kept after them, empty for newer scores
+        columns = SCORE_COLUMNS + [c for c in df.columns if c not in SCORE_COLUMNS]
+        df = df.reindex(columns=columns).sort_values('timestamp')
+        
         # Ensure output directory exists
         LOCAL_OUTPUT.parent.mkdir(exist_ok=True)
-        
-        # Download
-        blob.download_to_filename(str(LOCAL_OUTPUT))
+        df.to_csv(LOCAL_OUTPUT, index=False)
         
         print(f"✓ Downloaded to: {LOCAL_OUTPUT}")
         
         # Show summary
-        import pandas as pd
-        df = pd.read_csv(LOCAL_OUTPUT)
         print(f"\nTotal scores: {len(df)}")
         print(f"Unique raters: {df['rater_id'].nunique()}")
         print(f"Unique videos: {df['video'].nunique()}")
-        
+    
     except Exception as e:
         print(f"Error: {e}")
         print("\nMake sure:")
         print("  1. GCS credentials are configured")
-        print("  2. Scores file exists at gs://buildai-dataset/scores/scores.csv")
+        print(f"  2. Scores exist under gs://{GCS_BUCKET}/{GCS_SUBMISSIONS_PATH}/ or gs://{GCS_BUCKET}/{GCS_SCORES_PATH}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Build low-resolution / reduced-fps proxies of GCS videos for cheaper inference.
+
+Proxies are transcoded with ffmpeg and uploaded next to the source bucket under
+proxies/<profile>/<source blob path>. Each proxy records the source blob's
+generation and the profile settings in its blob metadata, so it is rebuilt only
+when the source video or the profile changes. `run_inference.py --proxy PROFILE`
+calls ensure_proxies() and sends the proxies to Vertex instead of the originals.
+
+With --benchmark, a sample of videos is inferred on the original, on the proxy
+and with the low media-resolution setting, and latency and token usage are
+compared.
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from dotenv import load_dotenv
+from google.cloud import storage
+
+# Load environment variables
+load_dotenv()
+
+PROJECT_ID = os.getenv("GCP_PROJECT_ID")
+PROXY_PREFIX = "proxies"
+# Only what the freshness check needs from a proxy listing
+PROXY_LISTING_FIELDS = "items(name,metadata),nextPageToken"
+
+# Factory videos are mostly static framing, so a few frames per second at
+# low resolution keep the steps visible. Vertex samples video at 1 fps anyway.
+PROXY_PROFILES = {
+    "240p1fps": {"height": 240, "fps": 1, "crf": 30, "audio": False},
+    "360p1fps": {"height": 360, "fps": 1, "crf": 28, "audio": False},
+    "480p2fps": {"height": 480, "fps": 2, "crf": 28, "audio": False},
+    "720p1fps": {"height": 720, "fps": 1, "crf": 26, "audio": False},
+}
+
+
+def check_ffmpeg():
+    """Check if ffmpeg is installed."""
+    try:
+        subprocess.run(
+            ["ffmpeg", "-version"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=True
+        )
+        return True
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return False
+
+
+def profile_fingerprint(profile_name: str) -> str:
+    """Short hash of a profile's settings; a proxy built with other settings is stale."""
+    settings = json.dumps(PROXY_PROFILES[profile_name], sort_keys=True)
+    return hashlib.sha256(settings.encode("utf-8")).hexdigest()[:16]
+
+
+def proxy_uri_for(video_uri: str, profile_name: str) -> str:
+    """gs:// URI where the proxy of a video for a profile lives."""
+    bucket_name, _, blob_name = video_uri.replace("gs://", "").partition("/")
+    return f"gs://{bucket_name}/{PROXY_PREFIX}/{profile_name}/{blob_name}"
+
+
+def ffmpeg_proxy_command(source: Path, target: Path, profile: Dict[str, Any]) -> List[str]:
+    """ffmpeg command that transcodes source into a proxy for the given profile."""
+    cmd = [
+        "ffmpeg", "-y", "-v", "error",
+        "-i", str(source),
+        # -2 keeps the aspect ratio with an even width (required by libx264)
+        "-vf", f"fps={profile['fps']},scale=-2:{profile['height']}",
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", str(profile["crf"]),
+        "-pix_fmt", "yuv420p",
+    ]
+    if profile["audio"]:
+        cmd += ["-c:a", "aac", "-ac", "1", "-b:a", "32k"]
+    else:
+        cmd += ["-an"]
+    cmd += ["-movflags", "+faststart", str(target)]
+    return cmd
+
+
+def build_proxy(storage_client, video_uri: str, profile_name: str, source_generation) -> Dict[str, Any]:
+    """Download a video, transcode it and upload the proxy with its provenance metadata."""
+    profile = PROXY_PROFILES[profile_name]
+    proxy_uri = proxy_uri_for(video_uri, profile_name)
+    bucket_name, _, blob_name = video_uri.replace("gs://", "").partition("/")
+    _, _, proxy_blob_name = proxy_uri.replace("gs://", "").partition("/")
+    bucket = storage_client.bucket(bucket_name)
+    
+    with tempfile.TemporaryDirectory(prefix="proxy_") as tmp:
+        source = Path(tmp) / Path(blob_name).name
+        target = Path(tmp) / f"proxy_{Path(blob_name).stem}.mp4"
+        
+        bucket.blob(blob_name).download_to_filename(str(source))
+        subprocess.run(
+            ffmpeg_proxy_command(source, target, profile),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=True
+        )
+        
+        proxy_blob = bucket.blob(proxy_blob_name)
+        proxy_blob.metadata = {
+            "source_uri": video_uri,
+            "source_generation": str(source_generation),
+            "profile": profile_name,
+            "profile_sha": profile_fingerprint(profile_name),
+        }
+        proxy_blob.upload_from_filename(str(target), content_type="video/mp4")
+        return {
+            "proxy_uri": proxy_uri,
+            "source_bytes": source.stat().st_size,
+            "proxy_bytes": target.stat().st_size,
+        }
+
+
+def ensure_proxies(sources: Dict[str, Any], profile_name: str, workers: int = 4) -> Dict[str, str]:
+    """Make sure an up-to-date proxy exists for every source video.
+    
+    sources maps video URI -> source blob generation (None if unknown, which
+    always rebuilds). Returns video URI -> proxy URI. Exits if proxies need
+    building and ffmpeg is missing, or if any proxy fails to build.
+    """
+    storage_client = storage.Client(project=PROJECT_ID)
+    fingerprint = profile_fingerprint(profile_name)
+    
+    print(f"Checking {profile_name} proxies for {len(sources)} videos...")
+    # One listing of the profile's proxies per bucket (with their metadata)
+    # instead of a lookup per video
+    existing = {}
+    for bucket_name in sorted(set(uri.replace("gs://", "").partition("/")[0] for uri in sources)):
+        blobs = storage_client.bucket(bucket_name).list_blobs(
+            prefix=f"{PROXY_PREFIX}/{profile_name}/", fields=PROXY_LISTING_FIELDS
+        )
+        for blob in blobs:
+            existing[f"gs://{bucket_name}/{blob.name}"] = blob.metadata or {}
+    
+    proxies = {}
+    stale = []
+    for video_uri, generation in sorted(sources.items()):
+        proxy_uri = proxy_uri_for(video_uri, profile_name)
+        metadata = existing.get(proxy_uri, {})
+        if (generation is not None
+                and metadata.get("source_generation") == str(generation)
+                and metadata.get("profile_sha") == fingerprint):
+            proxies[video_uri] = proxy_uri
+        else:
+            stale.append(video_uri)
+    print(f"  ✓ {len(proxies)} cached, {len(stale)} to build")
+    
+    if not stale:
+        return proxies
+    if not check_ffmpeg():
+        print("ERROR: ffmpeg is not installed!")
+        print("  Install with: brew install ffmpeg (macOS) or apt-get install ffmpeg (Linux)")
+        sys.exit(1)
+    
+    source_bytes = 0
+    proxy_bytes = 0
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(build_proxy, storage_client, uri, profile_name, sources[uri]): uri
+            for uri in stale
+        }
+        for future in as_completed(futures):
+            video_uri = futures[future]
+            video_name = video_uri.split("/")[-1]
+            try:
+                built = future.result()
+            except Exception as e:
+                print(f"  ✗ {video_name}: {e}")
+                failed.append(video_uri)
+                continue
+            proxies[video_uri] = built["proxy_uri"]
+            source_bytes += built["source_bytes"]
+            proxy_bytes += built["proxy_bytes"]
+            print(f"  ✓ {video_name}: {built['source_bytes'] / 1e6:.1f} MB -> {built['proxy_bytes'] / 1e6:.1f} MB")
+    
+    if failed:
+        print(f"ERROR: {len(failed)} proxies failed to build")
+        sys.exit(1)
+    if source_bytes:
+        print(f"  Built {len(stale)} proxies: {proxy_bytes / source_bytes:.1%} of source size")
+    return proxies
+
+
+def run_benchmark(video_uris: List[str], proxies: Dict[str, str], args) -> List[Dict[str, Any]]:
+    """Infer each video in every variant, one call at a time so latencies are comparable."""
+    from run_inference import MEDIA_RESOLUTIONS, generate_response, get_prompt, load_model, response_details
+    
+    model = load_model(args.model, args.model)
+    prompt = get_prompt(args.prompt)
+    low = {"media_resolution": MEDIA_RESOLUTIONS["low"]}
+    variants = [
+        ("original", lambda uri: uri, None),
+        (f"proxy:{args.profile}", lambda uri: proxies[uri], None),
+        ("media_resolution:low", lambda uri: uri, low),
+        (f"proxy:{args.profile}+low", lambda uri: proxies[uri], low),
+    ]
+    
+    rows = []
+    for video_uri in video_uris:
+        for variant, request_uri, generation_config in variants:
+            started = time.perf_counter()
+            try:
+                response = generate_response(model, request_uri(video_uri), prompt, generation_config=generation_config)
+                row = {"error": None, **response_details(response)["usage"]}
+            except Exception as e:
+                row = {"error": str(e), "prompt_tokens": 0, "output_tokens": 0, "thinking_tokens": 0, "total_tokens": 0}
+            row.update({
+                "video_uri": video_uri,
+                "variant": variant,
+                "latency": time.perf_counter() - started,
+            })
+            rows.append(row)
+    return rows
+
+
+def print_benchmark_report(rows: List[Dict[str, Any]]):
+    """Mean latency and tokens per variant, relative to the originals."""
+    variants = list(dict.fromkeys(row["variant"] for row in rows))
+    summary = {}
+    for variant in variants:
+        ok = [row for row in rows if row["variant"] == variant and not row["error"]]
+        summary[variant] = {
+            "calls": len(ok),
+            "errors": sum(1 for row in rows if row["variant"] == variant and row["error"]),
+            "latency": sum(row["latency"] for row in ok) / len(ok) if ok else 0.0,
+            "prompt_tokens": sum(row["prompt_tokens"] for row in ok) / len(ok) if ok else 0.0,
+            "total_tokens": sum(row["total_tokens"] for row in ok) / len(ok) if ok else 0.0,
+        }
+    
+    base = summary[variants[0]]
+    print(f"{'Variant':<28} {'Calls':>5} {'Errors':>6} {'Latency':>9} {'Prompt tok':>11} {'Total tok':>10} {'vs orig':>8}")
+    print("-" * 80)
+    for variant, stats in summary.items():
+        ratio = f"{stats['total_tokens'] / base['total_tokens']:.0%}" if base["total_tokens"] else "-"
+        print(f"{variant:<28} {stats['calls']:>5} {stats['errors']:>6} {stats['latency']:>8.1f}s "
+              f"{stats['prompt_tokens']:>11.0f} {stats['total_tokens']:>10.0f} {ratio:>8}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build cached low-res/low-fps proxies of GCS videos")
+    parser.add_argument(
+        "--gcs-path",
+        type=str,
+        default="gs://buildai-dataset/finetune_dataset/test/",
+        help="GCS path to videos (default: gs://buildai-dataset/finetune_dataset/test/)"
+    )
+    parser.add_argument(
+        "--profile",
+        type=str,
+        default="360p1fps",
+        choices=sorted(PROXY_PROFILES),
+        help="Proxy profile (default: 360p1fps)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Videos transcoded in parallel (default: 4)"
+    )
+    parser.add_argument(
+        "--benchmark",
+        action="store_true",
+        help="Compare latency and token usage of originals, proxies and low media resolution"
+    )
+    parser.add_argument(
+        "--benchmark-videos",
+        type=int,
+        default=3,
+        help="Number of videos to benchmark (default: 3)"
+    )
+    parser.add_argument(
+        "--model",
+        type=str,
+        default="gemini-2.5-pro",
+        help="Model ID or endpoint used for the benchmark (default: gemini-2.5-pro)"
+    )
+    parser.add_argument(
+        "--prompt",
+        type=str,
+        default="numbered",
+        choices=["default", "granular", "numbered"],
+        help="Prompt used for the benchmark (default: numbered)"
+    )
+    args = parser.parse_args()
+    
+    # Imported here so `run_inference.py --proxy` can import this module without a cycle
+    from run_inference import BASE_OUTPUT_DIR, VIDEO_METADATA, list_videos_from_gcs, write_json
+    
+    print("=" * 80)
+    print(f"Video Proxies ({args.profile}: {PROXY_PROFILES[args.profile]})")
+    print("=" * 80)
+    video_uris = list_videos_from_gcs(args.gcs_path)
+    if not video_uris:
+        print("ERROR: No videos found!")
+        sys.exit(1)
+    
+    print()
+    proxies = ensure_proxies(
+        {uri: VIDEO_METADATA.get(uri, {}).get("generation") for uri in video_uris},
+        args.profile,
+        workers=args.workers,
+    )
+    
+    if args.benchmark:
+        sample = video_uris[:args.benchmark_videos]
+        print()
+        print("=" * 80)
+        print(f"Benchmark: {args.model}, {len(sample)} videos, prompt '{args.prompt}'")
+        print("=" * 80)
+        rows = run_benchmark(sample, proxies, args)
+        summary = print_benchmark_report(rows)
+        
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        BASE_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+        output_path = BASE_OUTPUT_DIR / f"proxy_benchmark_{timestamp}.json"
+        write_json(output_path, {
+            "model": args.model,
+            "prompt": args.prompt,
+            "profile": args.profile,
+            "profile_settings": PROXY_PROFILES[args.profile],
+            "summary": summary,
+            "calls": rows,
+        })
+        print(f"\n✓ Benchmark saved to {output_path}")
+    
+    print()
+    print("=" * 80)
+    print(f"✓ {len(proxies)} proxies ready under {PROXY_PREFIX}/{args.profile}/")
+    print(f"  Use them with: python run_inference.py --proxy {args.profile} ...")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    main()
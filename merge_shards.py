@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Merge the runs of a sharded inference (run_inference.py --shard I/N) into one run.
+
+Each shard run holds the outputs for its share of the videos. This checks that
+the shards come from the same settings and the same video listing, that every
+shard 0..N-1 is present once, and that no video or output is missing or
+duplicated. It then copies json/, raw/, metrics and the manifest into one new
+run directory. Tasks a shard didn't finish stay pending in the merged manifest,
+so `run_inference.py --resume` can complete them.
+"""
+
+import sys
+import json
+import shutil
+import argparse
+from pathlib import Path
+from typing import List, Dict, Any
+
+from run_inference import (
+    MANIFEST_FILE,
+    METRICS_FILE,
+    RAW_DIR,
+    RUN_CONFIG_FILE,
+    TaskManifest,
+    create_run_dir,
+    shard_of,
+    write_json,
+)
+
+# run_config.json entries that may differ between shards of one run
+PER_SHARD_KEYS = ("shard", "created")
+
+
+def load_shard(run_dir: Path) -> Dict[str, Any]:
+    """Load a shard run's config and manifest."""
+    config_path = run_dir / RUN_CONFIG_FILE
+    if not config_path.exists() or not (run_dir / MANIFEST_FILE).exists():
+        print(f"ERROR: {run_dir} has no {RUN_CONFIG_FILE} / {MANIFEST_FILE}")
+        sys.exit(1)
+    with open(config_path) as f:
+        config = json.load(f)
+    if not config.get("shard"):
+        print(f"ERROR: {run_dir} is not a shard run (started without --shard)")
+        sys.exit(1)
+    return {"run_dir": run_dir, "config": config, "manifest": TaskManifest(run_dir)}
+
+
+def check_shards(shards: List[Dict[str, Any]]) -> List[str]:
+    """Problems that make the shards unmergeable (different settings, listings or shard sets)."""
+    problems = []
+    first = shards[0]["config"]
+    settings = {k: v for k, v in first.items() if k not in PER_SHARD_KEYS}
+    count = first["shard"]["count"]
+    
+    for shard in shards[1:]:
+        config = shard["config"]
+        name = shard["run_dir"].name
+        if {k: v for k, v in config.items() if k not in PER_SHARD_KEYS} != settings:
+            problems.append(f"{name}: model/prompt settings differ from {shards[0]['run_dir'].name}")
+        if config["shard"]["count"] != count:
+            problems.append(f"{name}: shard count {config['shard']['count']} != {count}")
+        if config["shard"]["listing_sha256"] != first["shard"]["listing_sha256"]:
+            problems.append(f"{name}: listed a different set of videos (the bucket changed between shards?)")
+    
+    indexes = [shard["config"]["shard"]["index"] for shard in shards]
+    for index in range(count):
+        if indexes.count(index) == 0:
+            problems.append(f"shard {index}/{count} is missing")
+        elif indexes.count(index) > 1:
+            problems.append(f"shard {index}/{count} is given {indexes.count(index)} times")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge the runs of a sharded inference into one run directory")
+    parser.add_argument(
+        "shard_dirs",
+        type=str,
+        nargs="+",
+        help="Shard run directories, one per shard (e.g., output/run_20251004_135336 from each machine)"
+    )
+    args = parser.parse_args()
+    
+    shards = sorted((load_shard(Path(p)) for p in args.shard_dirs), key=lambda s: s["config"]["shard"]["index"])
+    
+    print("=" * 80)
+    print(f"Merging {len(shards)} shard runs")
+    print("=" * 80)
+    for shard in shards:
+        info = shard["config"]["shard"]
+        print(f"  - {shard['run_dir']}: shard {info['index']}/{info['count']}, {shard['manifest'].counts()}")
+    print()
+    
+    problems = check_shards(shards)
+    
+    # Every task must be in the shard its video hashes to, and in no other
+    owners: Dict[str, Path] = {}
+    outputs: Dict[str, Path] = {}
+    for shard in shards:
+        info = shard["config"]["shard"]
+        for key, task in shard["manifest"].tasks.items():
+            if shard_of(task["video_uri"], info["count"]) != info["index"]:
+                problems.append(f"{key}: in shard {info['index']} but belongs to {shard_of(task['video_uri'], info['count'])}")
+            if key in owners:
+                problems.append(f"{key}: duplicated in {owners[key].name} and {shard['run_dir'].name}")
+            owners[key] = shard["run_dir"]
+            if task["state"] == "done":
+                output = task.get("output")
+                if output in outputs:
+                    problems.append(f"{output}: written by both {outputs[output].name} and {shard['run_dir'].name}")
+                elif not (shard["run_dir"] / output).exists():
+                    problems.append(f"{key}: marked done but {shard['run_dir'].name}/{output} is missing")
+                outputs[output] = shard["run_dir"]
+    
+    listed = shards[0]["config"]["shard"]["listed_videos"]
+    videos = set(task["video_uri"] for shard in shards for task in shard["manifest"].tasks.values())
+    if len(videos) != listed:
+        problems.append(f"{listed - len(videos)} of {listed} listed videos have no tasks in any shard")
+    
+    if problems:
+        print("✗ Shards can't be merged:")
+        for problem in problems:
+            print(f"  - {problem}")
+        sys.exit(1)
+    
+    run_dir = create_run_dir()
+    run_config = {k: v for k, v in shards[0]["config"].items() if k not in PER_SHARD_KEYS}
+    run_config["created"] = shards[0]["config"].get("created")
+    run_config["merged_from"] = [str(shard["run_dir"]) for shard in shards]
+    write_json(run_dir / RUN_CONFIG_FILE, run_config)
+    
+    manifest = TaskManifest(run_dir)
+    for shard in shards:
+        source = shard["run_dir"]
+        for name in ("json", RAW_DIR):
+            if (source / name).is_dir():
+                (run_dir / name).mkdir(exist_ok=True)
+                for path in (source / name).glob("*.json"):
+                    shutil.copy2(path, run_dir / name / path.name)
+        if (source / METRICS_FILE).exists():
+            with open(source / METRICS_FILE) as src, open(run_dir / METRICS_FILE, 'a') as dst:
+                shutil.copyfileobj(src, dst)
+        for key, task in shard["manifest"].tasks.items():
+            manifest.add_task(task["video_uri"], task["model_name"], task["model_id"], task["prompt_type"], task.get("video"))
+            fields = {k: v for k, v in task.items() if k not in ("video_uri", "model_name", "model_id", "prompt_type", "video", "state")}
+            manifest.update(key, task["state"], shard=str(source), **fields)
+    
+    unfinished = len(manifest.unfinished())
+    print("-" * 80)
+    print(f"  Videos: {len(videos)}/{listed}")
+    print(f"  Tasks: {manifest.counts()}")
+    print()
+    print("=" * 80)
+    print(f"✓ Merged run: {run_dir}")
+    if unfinished:
+        print(f"  {unfinished} tasks are not done. Next: python run_inference.py --resume {run_dir}")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    main()
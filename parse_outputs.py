@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Re-parse a run's raw model responses into its json/ outputs.
+
+run_inference.py stores every response unparsed in <run>/raw/ (text, token
+usage, finish reason and latency per call). After changing the parsing or
+clean-up logic in run_inference.py, run this to rebuild <run>/json/ from those
+responses without calling the models again.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+from typing import Dict, Any
+from concurrent.futures import ProcessPoolExecutor
+
+from run_inference import RAW_DIR, build_output, count_steps, write_json
+
+
+def parse_raw_file(raw_path: Path, json_dir: Path) -> Dict[str, Any]:
+    """Rebuild one output JSON from its raw record."""
+    with open(raw_path) as f:
+        raw = json.load(f)
+    result, parse_error = build_output(raw)
+    write_json(json_dir / raw_path.name, result)
+    return {
+        "name": raw_path.stem,
+        "model_name": raw["model_name"],
+        "prompt_type": raw["prompt_type"],
+        "error": raw.get("error"),
+        "parse_error": parse_error,
+        "segments": 0 if raw.get("error") else count_steps(result),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild a run's json/ outputs from its raw/ responses")
+    parser.add_argument(
+        "run_dir",
+        type=str,
+        help="Inference run directory (e.g., output/run_20251004_135336)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Parallel parser processes (default: CPU count)"
+    )
+    args = parser.parse_args()
+    
+    run_dir = Path(args.run_dir)
+    raw_files = sorted((run_dir / RAW_DIR).glob("*.json"))
+    if not raw_files:
+        print(f"ERROR: No raw responses in {run_dir / RAW_DIR}")
+        print("  Runs made before raw responses were stored can only be re-inferred.")
+        sys.exit(1)
+    
+    json_dir = run_dir / "json"
+    json_dir.mkdir(exist_ok=True)
+    
+    print("=" * 80)
+    print(f"Parsing {len(raw_files)} raw responses in {run_dir}")
+    print("=" * 80)
+    
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        outputs = list(executor.map(parse_raw_file, raw_files, [json_dir] * len(raw_files), chunksize=16))
+    elapsed = time.perf_counter() - start
+    
+    for output in outputs:
+        if output["error"]:
+            print(f"  ✗ {output['name']}: {output['error']}")
+        elif output["parse_error"]:
+            print(f"  ✗ {output['name']}: {output['parse_error']}")
+    
+    print()
+    print("-" * 80)
+    for model_name, prompt_type in sorted(set((o["model_name"], o["prompt_type"]) for o in outputs)):
+        group = [o for o in outputs if (o["model_name"], o["prompt_type"]) == (model_name, prompt_type) and not o["error"]]
+        unparsed = sum(1 for o in group if o["parse_error"])
+        steps = sum(o["segments"] for o in group)
+        print(f"  {model_name}/{prompt_type}: {len(group)} outputs, {unparsed} unparsed, {steps} steps")
+    
+    print()
+    print("=" * 80)
+    print(f"✓ Rebuilt {len(outputs)} outputs in {elapsed:.1f}s")
+    print(f"  JSON outputs saved to: {json_dir}")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,15 +7,36 @@ Saves JSON outputs for comparison.
 import os
 import json
 import sys
+import math
+import time
+import random
+import socket
+import asyncio
+import sqlite3
+import hashlib
 import argparse
+import subprocess
+import urllib.parse
 from pathlib import Path
-from typing import List, Dict, Any
+from contextlib import contextmanager
+from typing import List, Dict, Any, Tuple
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from datetime import datetime
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
+from google.api_core.exceptions import (
+    Aborted,
+    BadGateway,
+    DeadlineExceeded,
+    GatewayTimeout,
+    InternalServerError,
+    NotFound,
+    ResourceExhausted,
+    ServiceUnavailable,
+    TooManyRequests,
+)
 from google.cloud import storage
 import vertexai
-from vertexai.generative_models import GenerativeModel, Part
+from vertexai.generative_models import GenerationConfig, GenerativeModel, Part
 
 # Load environment variables
 load_dotenv()
@@ -25,15 +46,123 @@ LOCATION = os.getenv("GCP_LOCATION")
 FINETUNED_ENDPOINT = os.getenv("FINETUNED_MODEL_ENDPOINT")
 BASE_OUTPUT_DIR = Path(os.getenv("OUTPUT_DIR", "./output"))
 
-# Create timestamped output directory
-timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-OUTPUT_DIR = BASE_OUTPUT_DIR / f"run_{timestamp}"
-JSON_OUTPUT_DIR = OUTPUT_DIR / "json"
-JSON_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+# Files kept at the root of each run directory (next to json/)
+RUN_CONFIG_FILE = "run_config.json"
+MANIFEST_FILE = "manifest.jsonl"
+QUEUE_FILE = "queue.db"
+RAW_DIR = "raw"
+METRICS_FILE = "metrics.jsonl"
+
+# Run settings that change every output of a run (for both models)
+OUTPUT_SETTING_KEYS = (
+    "proxy", "media_resolution", "structured", "candidates", "chunk_seconds", "chunk_overlap",
+)
+
+# Run settings that define a run's tasks; saved in run_config.json
+RUN_CONFIG_KEYS = (
+    "gcs_path", "model1", "model2", "model1_name", "model2_name",
+    "model1_prompt", "model2_prompt", "model1_no_prompt", "model2_no_prompt",
+    "model1_profile", "model2_profile",
+) + OUTPUT_SETTING_KEYS
+
+# Local cache of model responses, shared by all runs
+CACHE_DIR = Path(os.getenv("INFERENCE_CACHE_DIR", "./cache/responses"))
+CACHE_MAX_MB = 1024
+CACHE_LOW_WATER = 0.9  # Eviction frees the cache down to this fraction of its budget
+
+# Local snapshots of GCS video listings, reused while blob generations match
+LISTING_DIR = Path(os.getenv("INFERENCE_LISTING_DIR", "./cache/listings"))
+VIDEO_GLOB = "*.{mp4,mov,avi,MP4,MOV,AVI}"
+LISTING_FIELDS = "items(name,size,generation,crc32c),prefixes,nextPageToken"
 
 # Initialize Vertex AI
 vertexai.init(project=PROJECT_ID, location=LOCATION)
 
+# Retry / deadline defaults (overridable from the command line)
+DEFAULT_RETRY_POLICY = {
+    "max_attempts": 6,          # total calls per task, including the first
+    "backoff_base": 2.0,        # seconds; attempt n waits up to base * 2**(n-1)
+    "backoff_max": 60.0,        # cap on a single backoff sleep
+    "deadline_base": 120.0,     # seconds allowed for any call
+    "deadline_per_second": 2.0, # extra seconds allowed per second of video
+    "deadline_max": 1800.0,     # hard cap on a single call
+    "invalid_retries": 1,       # extra calls when a response fails to parse/validate
+}
+
+# Assumed bitrate used to estimate duration from blob size when it isn't known
+ASSUMED_VIDEO_BITRATE_MBPS = 8.0
+
+# Response schema for the timestamped prompts (--structured). Constrains decoding
+# to the cutSegments shape so responses always parse.
+CUT_SEGMENTS_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "cutSegments": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "start": {"type": "STRING", "description": "Start timestamp, MM:SS (or MM:SS.ss if asked)"},
+                    "end": {"type": "STRING", "description": "End timestamp, same format as start"},
+                    "label": {"type": "STRING"},
+                    "description": {"type": "STRING"},
+                },
+                "required": ["start", "end", "label", "description"],
+            },
+        },
+    },
+    "required": ["cutSegments"],
+}
+
+# Named generation settings selectable per model (--model1-profile/--model2-profile).
+# Thinking dominates gemini-2.5-pro latency, so the cheaper profiles cap its
+# budget (128 is the lowest 2.5 Pro accepts; Flash models also take 0).
+GENERATION_PROFILES = {
+    "default": {},
+    "fast": {
+        "thinking_config": {"thinking_budget": 128},
+        "max_output_tokens": 4096,
+        "temperature": 0.2,
+    },
+    "balanced": {
+        "thinking_config": {"thinking_budget": 1024},
+        "max_output_tokens": 8192,
+        "temperature": 0.5,
+    },
+    "thorough": {
+        "thinking_config": {"thinking_budget": 8192},
+        "max_output_tokens": 32768,
+        "temperature": 1.0,
+    },
+}
+
+# --media-resolution choices -> GenerationConfig media_resolution values
+MEDIA_RESOLUTIONS = {
+    "low": "MEDIA_RESOLUTION_LOW",
+    "medium": "MEDIA_RESOLUTION_MEDIUM",
+    "high": "MEDIA_RESOLUTION_HIGH",
+}
+
+# Prior for per-call latency used to predict a run's makespan:
+# latency ~= base_s + per_video_second * video duration
+DEFAULT_LATENCY_MODEL = {"base_s": 15.0, "per_video_second": 0.3}
+
+# Errors worth retrying: quota, transient server-side failures and timeouts
+RETRYABLE_ERRORS = (
+    ResourceExhausted,
+    TooManyRequests,
+    ServiceUnavailable,
+    InternalServerError,
+    BadGateway,
+    GatewayTimeout,
+    DeadlineExceeded,
+    Aborted,
+    asyncio.TimeoutError,
+)
+
+# Blob metadata (size, generation, crc32c) for every listed video, keyed by gs:// URI
+VIDEO_METADATA: Dict[str, Dict[str, Any]] = {}
+
 # Default prompts
 DEFAULT_PROMPT = """You're watching an egocentric video, of a factory operator performing a task. Your goal is to understand how the task is performed, and identify all the steps. You must NOT miss any of the steps the factory operator is performing. You must NOT hallucinate any of the steps either.
 
@@ -85,8 +214,286 @@ Focus only on what the wearer is doing with their hands, tools, and materials. I
 Do not assume steps. Only include what is explicitly seen in the video."""
 
 
-def list_videos_from_gcs(gcs_path: str) -> List[str]:
-    """List videos from GCS bucket matching sample1-sample10 pattern."""
+def get_prompt(prompt_type: str) -> str:
+    """Return the prompt text for a prompt type ('none' means no prompt)."""
+    if prompt_type == "none":
+        return None
+    if prompt_type == "granular":
+        return GRANULAR_TIMESTAMP_PROMPT
+    elif prompt_type == "numbered":
+        return NUMBERED_LIST_PROMPT
+    else:
+        return DEFAULT_PROMPT
+
+
+def load_model(model_id: str, model_name: str) -> GenerativeModel:
+    """Load a model with error handling."""
+    print(f"Loading {model_name}: {model_id}...")
+    
+    # Check if it's a base model name or an endpoint
+    if model_id.startswith("gemini-"):
+        return GenerativeModel(model_id)
+    
+    # Try different endpoint formats
+    try:
+        # Format 1: Direct endpoint reference
+        return GenerativeModel(
+            f"projects/{PROJECT_ID}/locations/{LOCATION}/endpoints/{model_id}"
+        )
+    except Exception as e:
+        print(f"  Format 1 failed: {e}")
+        try:
+            # Format 2: Just the endpoint ID
+            return GenerativeModel(model_id)
+        except Exception as e2:
+            print(f"  Format 2 failed: {e2}")
+            print(f"  ERROR: Could not initialize {model_name}")
+            sys.exit(1)
+
+
+def create_run_dir(base_dir: Path = BASE_OUTPUT_DIR) -> Path:
+    """Create a new timestamped run directory with its json/ subfolder."""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    run_dir = base_dir / f"run_{timestamp}"
+    (run_dir / "json").mkdir(parents=True, exist_ok=True)
+    return run_dir
+
+
+def video_name_from_uri(video_uri: str) -> str:
+    """Video name used in output filenames (basename without extension)."""
+    return video_uri.split('/')[-1].rsplit('.', 1)[0]
+
+
+class TaskManifest:
+    """Append-only record of a run's (video_uri, model, prompt_type) tasks.
+    
+    Each line of manifest.jsonl is either a task definition or a state change
+    (pending -> running -> done | failed). Replaying the file gives the latest
+    state of every task, so a crashed or interrupted run can be resumed by
+    dispatching everything that isn't done yet.
+    """
+    
+    def __init__(self, run_dir: Path):
+        self.path = run_dir / MANIFEST_FILE
+        self.tasks: Dict[str, Dict[str, Any]] = {}
+        if self.path.exists():
+            with open(self.path) as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Torn final line from a crash mid-write
+                        continue
+                    if record.get("type") == "task":
+                        self.tasks[record["key"]] = record["task"]
+                    elif record["key"] in self.tasks:
+                        self.tasks[record["key"]].update(record["update"])
+    
+    @staticmethod
+    def task_key(video_uri: str, model_name: str, prompt_type: str) -> str:
+        return f"{video_uri}|{model_name}|{prompt_type}"
+    
+    def _append(self, record: Dict[str, Any]):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+    
+    def add_task(self, video_uri: str, model_name: str, model_id: str, prompt_type: str,
+                 video_metadata: Dict[str, Any] = None) -> str:
+        """Register a task (no-op if already present) and return its key."""
+        key = self.task_key(video_uri, model_name, prompt_type)
+        if key not in self.tasks:
+            task = {
+                "video_uri": video_uri,
+                "model_name": model_name,
+                "model_id": model_id,
+                "prompt_type": prompt_type,
+                "video": video_metadata or {},
+                "state": "pending",
+                "attempts": 0,
+            }
+            self.tasks[key] = task
+            self._append({"type": "task", "key": key, "task": task})
+        return key
+    
+    def update(self, key: str, state: str, **fields):
+        """Record a state change (plus any extra fields) for a task."""
+        update = {"state": state, "updated": datetime.now().isoformat(), **fields}
+        self.tasks[key].update(update)
+        self._append({"type": "update", "key": key, "update": update})
+    
+    def unfinished(self) -> List[str]:
+        """Keys of tasks that still need to run (pending, failed or interrupted)."""
+        return [key for key, task in self.tasks.items() if task["state"] != "done"]
+    
+    def counts(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for task in self.tasks.values():
+            counts[task["state"]] = counts.get(task["state"], 0) + 1
+        return counts
+
+
+class WorkQueue:
+    """SQLite task table shared by the worker processes of a run (--queue).
+    
+    Workers claim one task at a time, leasing it for lease_seconds. The lease
+    is renewed by heartbeats while the task runs. A task whose lease expired
+    (its worker crashed or hung) is claimable again, so other workers pick it
+    up. Tasks are claimed in the order they were added, i.e. the schedule
+    order of the process that created the queue. The task manifest stays the
+    record of each task's outcome; the queue only decides who runs what.
+    """
+    
+    def __init__(self, path: Path, lease_seconds: float = 120.0):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.worker = f"{socket.gethostname()}-{os.getpid()}"
+        self.reclaimed = 0
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tasks ("
+                " key TEXT PRIMARY KEY, position INTEGER NOT NULL,"
+                " state TEXT NOT NULL DEFAULT 'pending', worker TEXT, lease_expires REAL,"
+                " claims INTEGER NOT NULL DEFAULT 0)"
+            )
+    
+    @contextmanager
+    def _connect(self):
+        # One short-lived connection per call, so methods can run in any thread
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+    
+    def add(self, keys: List[str]):
+        """Add tasks in claim order (tasks already in the queue keep their state)."""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            start = conn.execute("SELECT COALESCE(MAX(position), -1) + 1 FROM tasks").fetchone()[0]
+            conn.executemany(
+                "INSERT OR IGNORE INTO tasks (key, position) VALUES (?, ?)",
+                ((key, start + i) for i, key in enumerate(keys)),
+            )
+            conn.execute("COMMIT")
+    
+    def requeue_failed(self) -> int:
+        """Make failed tasks claimable again (as --resume does without a queue)."""
+        with self._connect() as conn:
+            return conn.execute("UPDATE tasks SET state = 'pending', worker = NULL WHERE state = 'failed'").rowcount
+    
+    def claim(self) -> str:
+        """Lease the next pending or expired task to this worker; None if there is none right now."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT key, state FROM tasks"
+                " WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?)"
+                " ORDER BY position LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row:
+                conn.execute(
+                    "UPDATE tasks SET state = 'leased', worker = ?, lease_expires = ?, claims = claims + 1 WHERE key = ?",
+                    (self.worker, now + self.lease_seconds, row[0]),
+                )
+            conn.execute("COMMIT")
+        if not row:
+            return None
+        if row[1] == "leased":
+            self.reclaimed += 1
+            print(f"[QUEUE] Reclaimed expired lease: {row[0]}")
+        return row[0]
+    
+    def heartbeat(self):
+        """Renew the leases of every task this worker is running."""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE tasks SET lease_expires = ? WHERE state = 'leased' AND worker = ?",
+                (time.time() + self.lease_seconds, self.worker),
+            )
+    
+    def finish(self, key: str, state: str):
+        """Record a claimed task as done or failed."""
+        with self._connect() as conn:
+            conn.execute("UPDATE tasks SET state = ?, lease_expires = NULL WHERE key = ?", (state, key))
+    
+    def release(self, key: str):
+        """Give a claimed task back unfinished (e.g. on interrupt) so another worker takes it now."""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE tasks SET state = 'pending', worker = NULL, lease_expires = NULL"
+                " WHERE key = ? AND state = 'leased' AND worker = ?",
+                (key, self.worker),
+            )
+    
+    def leased_elsewhere(self) -> int:
+        """Tasks currently leased to other workers (they may still come back if those workers die)."""
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM tasks WHERE state = 'leased' AND worker != ?", (self.worker,)
+            ).fetchone()[0]
+    
+    def counts(self) -> Dict[str, int]:
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state").fetchall())
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """Parse a --shard I/N value into (index, count)."""
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected I/N (e.g. 0/4), got '{value}'")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"shard index must be in 0..N-1, got '{value}'")
+    return index, count
+
+
+def shard_of(video_uri: str, count: int) -> int:
+    """Shard a video belongs to: a stable hash of its URI, the same on every machine."""
+    return int(hashlib.sha256(video_uri.encode()).hexdigest()[:16], 16) % count
+
+
+def listing_digest(video_uris: List[str]) -> str:
+    """Hash of a video listing, so shards can check they split the same set."""
+    return hashlib.sha256("\n".join(sorted(video_uris)).encode()).hexdigest()
+
+
+def listing_snapshot_path(bucket_name: str, prefix: str) -> Path:
+    """Local file holding the last listing of a GCS prefix."""
+    digest = hashlib.sha256(f"{bucket_name}/{prefix}".encode()).hexdigest()[:16]
+    return LISTING_DIR / f"{digest}.json"
+
+
+def save_listing_snapshot(gcs_path: str, video_uris: List[str]):
+    """Save the current VIDEO_METADATA (incl. probed durations) of a listing."""
+    bucket_name, _, prefix = gcs_path.replace("gs://", "").partition("/")
+    if prefix and not prefix.endswith('/'):
+        prefix = prefix + '/'
+    LISTING_DIR.mkdir(parents=True, exist_ok=True)
+    write_json(listing_snapshot_path(bucket_name, prefix), {
+        "gcs_path": f"gs://{bucket_name}/{prefix}",
+        "listed": datetime.now().isoformat(),
+        "videos": {uri: VIDEO_METADATA.get(uri, {}) for uri in video_uris},
+    })
+
+
+def list_videos_from_gcs(gcs_path: str, quiet: bool = False) -> List[str]:
+    """List the videos at the root of a GCS prefix and record their metadata.
+    
+    The listing is done server-side: the "/" delimiter stops it descending
+    into subfolders, a glob matches the video extensions, and only the fields
+    used here are returned. Metadata of videos whose generation is unchanged
+    since the last listing (including probed durations) is reused from the
+    local snapshot.
+    """
     # Parse GCS path (format: gs://bucket/prefix or bucket/prefix)
     gcs_path = gcs_path.replace("gs://", "")
     parts = gcs_path.split("/", 1)
@@ -97,25 +504,47 @@ def list_videos_from_gcs(gcs_path: str) -> List[str]:
     if prefix and not prefix.endswith('/'):
         prefix = prefix + '/'
     
-    print(f"Listing videos from gs://{bucket_name}/{prefix}...")
+    if not quiet:
+        print(f"Listing videos from gs://{bucket_name}/{prefix}...")
+    
+    snapshot_path = listing_snapshot_path(bucket_name, prefix)
+    snapshot = {}
+    if snapshot_path.exists():
+        with open(snapshot_path) as f:
+            snapshot = json.load(f).get("videos", {})
     
     storage_client = storage.Client(project=PROJECT_ID)
     bucket = storage_client.bucket(bucket_name)
-    blobs = bucket.list_blobs(prefix=prefix)
+    blobs = bucket.list_blobs(
+        prefix=prefix,
+        delimiter="/",
+        match_glob=prefix + VIDEO_GLOB,
+        fields=LISTING_FIELDS,
+    )
     
     video_uris = []
+    reused = 0
     for blob in blobs:
-        # Only get files in the root of the prefix (not subfolders)
-        relative_path = blob.name[len(prefix):] if prefix else blob.name
-        if '/' in relative_path:
-            continue
-        
-        # Get all video files (mp4, mov, avi)
-        if blob.name.endswith(('.mp4', '.mov', '.avi', '.MP4', '.MOV', '.AVI')):
-            video_uri = f"gs://{bucket_name}/{blob.name}"
-            video_uris.append(video_uri)
+        video_uri = f"gs://{bucket_name}/{blob.name}"
+        video_uris.append(video_uri)
+        previous = snapshot.get(video_uri, {})
+        if previous.get("generation") == blob.generation:
+            VIDEO_METADATA[video_uri] = previous
+            reused += 1
+        else:
+            VIDEO_METADATA[video_uri] = {
+                "size": blob.size,
+                "generation": blob.generation,
+                "crc32c": blob.crc32c,
+            }
     
     video_uris = sorted(set(video_uris))
+    if snapshot and not quiet:
+        print(f"Listing snapshot: {reused} unchanged, {len(video_uris) - reused} new or changed, "
+              f"{len(set(snapshot) - set(video_uris))} removed")
+    save_listing_snapshot(gcs_path, video_uris)
+    if quiet:
+        return video_uris
     print(f"Found {len(video_uris)} videos:")
     for uri in video_uris:
         print(f"  - {uri}")
@@ -123,21 +552,57 @@ def list_videos_from_gcs(gcs_path: str) -> List[str]:
     return video_uris
 
 
-def run_inference(model: GenerativeModel, video_uri: str, prompt: str = None, expect_json: bool = True) -> Dict[str, Any]:
-    """Run inference on a video using the specified model."""
-    print(f"  Running inference on {video_uri.split('/')[-1]}...")
+def seconds_to_duration(seconds: float) -> Dict[str, int]:
+    """Convert seconds to a protobuf Duration dict."""
+    whole = int(seconds)
+    return {"seconds": whole, "nanos": int(round((seconds - whole) * 1e9))}
+
+
+def parse_timestamp(value: Any) -> float:
+    """Parse a model timestamp ("MM:SS", "MM:SS.ss", "H:MM:SS" or seconds) into seconds."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    seconds = 0.0
+    for part in str(value).strip().split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def format_timestamp(seconds: float, precise: bool = False) -> str:
+    """Format seconds as MM:SS (or MM:SS.ss when precise), matching the prompts."""
+    minutes, secs = divmod(max(seconds, 0.0), 60)
+    if precise:
+        return f"{int(minutes):02d}:{secs:05.2f}"
+    return f"{int(minutes):02d}:{int(round(secs)):02d}"
+
+
+def build_contents(video_uri: str, prompt: str = None, window: Tuple[float, float] = None) -> List[Any]:
+    """Build the request contents for a video, with or without a text prompt.
     
-    # Create video part from GCS URI
-    video_part = Part.from_uri(video_uri, mime_type="video/mp4")
+    If a (start, end) window in seconds is given, only that part of the video
+    is sent, using the Part's video offset metadata. With no video_uri the
+    video is expected to be in the model's cached content already.
+    """
+    if video_uri is None:
+        return [prompt]
     
-    # Generate content with or without prompt
-    if prompt:
-        response = model.generate_content([prompt, video_part])
+    # Create video part from GCS URI
+    if window:
+        video_part = Part.from_dict({
+            "file_data": {"file_uri": video_uri, "mime_type": "video/mp4"},
+            "video_metadata": {
+                "start_offset": seconds_to_duration(window[0]),
+                "end_offset": seconds_to_duration(window[1]),
+            },
+        })
     else:
-        response = model.generate_content([video_part])
-    
-    # Extract text from response
-    response_text = response.text.strip()
+        video_part = Part.from_uri(video_uri, mime_type="video/mp4")
+    return [prompt, video_part] if prompt else [video_part]
+
+
+def parse_response_text(response_text: str, expect_json: bool = True) -> Dict[str, Any]:
+    """Parse raw model text into the output structure saved for each video."""
+    response_text = response_text.strip()
     
     # If not expecting JSON (numbered list format), return as-is
     if not expect_json:
@@ -170,221 +635,2222 @@ def run_inference(model: GenerativeModel, video_uri: str, prompt: str = None, ex
         }
 
 
-def main():
-    """Main execution function."""
-    # Parse command line arguments
-    parser = argparse.ArgumentParser(description="Run inference on videos using Gemini models")
-    parser.add_argument(
-        "--gcs-path",
-        type=str,
-        default=f"{os.getenv('GCS_BUCKET', 'buildai-dataset')}/{os.getenv('GCS_PREFIX', 'finetune_dataset/')}",
-        help="GCS path to videos (e.g., gs://bucket/prefix or bucket/prefix). Default from .env"
-    )
-    parser.add_argument(
-        "--model1",
-        type=str,
-        default=os.getenv("FINETUNED_MODEL_ENDPOINT"),
-        help="First model endpoint ID. Default from .env"
-    )
-    parser.add_argument(
-        "--model2",
-        type=str,
-        default="gemini-2.5-pro",
-        help="Second model endpoint ID or name. Default: gemini-2.5-pro"
-    )
-    parser.add_argument(
-        "--model1-name",
-        type=str,
-        default="model1",
-        help="Name for first model in output files. Default: model1"
-    )
-    parser.add_argument(
-        "--model2-name",
-        type=str,
-        default="model2",
-        help="Name for second model in output files. Default: model2"
-    )
-    parser.add_argument(
-        "--model1-no-prompt",
-        action="store_true",
-        help="Don't send prompt to model1, just send the video"
-    )
-    parser.add_argument(
-        "--model2-no-prompt",
-        action="store_true",
-        help="Don't send prompt to model2, just send the video"
-    )
-    parser.add_argument(
-        "--model1-prompt",
-        type=str,
-        choices=["default", "granular", "numbered"],
-        default="default",
-        help="Which prompt to use for model1: 'default' (MM:SS), 'granular' (MM:SS.ss), or 'numbered' (numbered list)"
+def response_details(response) -> Dict[str, Any]:
+    """Token counts and finish reason of a generate_content response."""
+    usage = getattr(response, "usage_metadata", None)
+    candidates = getattr(response, "candidates", None) or []
+    finish_reason = getattr(candidates[0], "finish_reason", None) if candidates else None
+    return {
+        "usage": {
+            "prompt_tokens": getattr(usage, "prompt_token_count", 0) or 0,
+            "output_tokens": getattr(usage, "candidates_token_count", 0) or 0,
+            "thinking_tokens": getattr(usage, "thoughts_token_count", 0) or 0,
+            "total_tokens": getattr(usage, "total_token_count", 0) or 0,
+        },
+        "finish_reason": getattr(finish_reason, "name", finish_reason),
+    }
+
+
+def candidate_texts(response) -> List[str]:
+    """Text of every candidate in a response (a single entry unless candidate_count > 1)."""
+    candidates = getattr(response, "candidates", None) or []
+    if len(candidates) <= 1:
+        return [response.text]
+    texts = []
+    for candidate in candidates:
+        try:
+            texts.append(candidate.text)
+        except (ValueError, AttributeError):
+            # Candidate without text (e.g. stopped for safety)
+            texts.append("")
+    return texts
+
+
+def candidate_summary(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Step-count spread across the parsed candidates of one output."""
+    steps = [count_steps(result) for result in results if "error" not in result]
+    summary = {"count": len(results), "parsed": len(steps), "steps": steps}
+    if steps:
+        mean = sum(steps) / len(steps)
+        summary.update({
+            "min": min(steps),
+            "max": max(steps),
+            "mean": round(mean, 2),
+            "stdev": round(math.sqrt(sum((s - mean) ** 2 for s in steps) / len(steps)), 2),
+        })
+    return summary
+
+
+def validate_result(result: Dict[str, Any]) -> str:
+    """Check a parsed timestamped response; returns an error message, or None if valid."""
+    if "error" in result:
+        return result["error"]
+    segments = result.get("cutSegments")
+    if not isinstance(segments, list):
+        return "Missing cutSegments list"
+    for i, segment in enumerate(segments):
+        if not isinstance(segment, dict) or "start" not in segment or "end" not in segment:
+            return f"Segment {i} has no start/end"
+        try:
+            start, end = parse_timestamp(segment["start"]), parse_timestamp(segment["end"])
+        except ValueError:
+            return f"Segment {i} has an unparseable timestamp ({segment['start']!r}, {segment['end']!r})"
+        if end < start:
+            return f"Segment {i} ends before it starts"
+    return None
+
+
+def make_generation_config(config: Dict[str, Any]) -> GenerationConfig:
+    """Build a GenerationConfig from a plain dict (None if empty).
+    
+    Fields are passed straight through to the GenerationConfig proto, so
+    settings the SDK has no keyword for yet (media_resolution, thinking_config)
+    work as long as the installed google-cloud-aiplatform knows the field.
+    """
+    if not config:
+        return None
+    return GenerationConfig.from_dict(config)
+
+
+class StreamedResponse:
+    """A streamed generate_content response gathered back into one response.
+    
+    Exposes the same .text / .usage_metadata / .candidates that callers use on
+    a regular response; usage and finish reason come with the last chunk.
+    """
+    
+    def __init__(self, chunks: List[Any]):
+        self.chunks = chunks
+        self.usage_metadata = getattr(chunks[-1], "usage_metadata", None) if chunks else None
+        self.candidates = getattr(chunks[-1], "candidates", None) if chunks else None
+    
+    @property
+    def text(self) -> str:
+        texts = []
+        for chunk in self.chunks:
+            try:
+                texts.append(chunk.text)
+            except ValueError:
+                # Chunks without text parts (e.g. the final usage-only chunk)
+                continue
+        return "".join(texts)
+
+
+def generate_response(model: GenerativeModel, video_uri: str, prompt: str = None,
+                      window: Tuple[float, float] = None, generation_config: Dict[str, Any] = None,
+                      stream: bool = False, timing: Dict[str, float] = None):
+    """Call generate_content for a video and return the raw response.
+    
+    If a timing dict is given, the perf_counter() time the call actually
+    started is stored under "started" (after any wait for a pool thread) and,
+    when streaming, the arrival of the first chunk under "first_byte".
+    """
+    timing = {} if timing is None else timing
+    timing["started"] = time.perf_counter()
+    print(f"  Running inference on {video_uri.split('/')[-1] if video_uri else 'cached video'}...")
+    response = model.generate_content(
+        build_contents(video_uri, prompt, window),
+        generation_config=make_generation_config(generation_config),
+        stream=stream,
     )
-    parser.add_argument(
-        "--model2-prompt",
-        type=str,
-        choices=["default", "granular", "numbered"],
-        default="default",
-        help="Which prompt to use for model2: 'default' (MM:SS), 'granular' (MM:SS.ss), or 'numbered' (numbered list)"
+    if not stream:
+        return response
+    chunks = []
+    for chunk in response:
+        timing.setdefault("first_byte", time.perf_counter())
+        chunks.append(chunk)
+    return StreamedResponse(chunks)
+
+
+async def generate_response_async(model: GenerativeModel, video_uri: str, prompt: str = None,
+                                  window: Tuple[float, float] = None, generation_config: Dict[str, Any] = None,
+                                  stream: bool = False, timing: Dict[str, float] = None):
+    """Async variant of generate_response() built on generate_content_async."""
+    timing = {} if timing is None else timing
+    timing["started"] = time.perf_counter()
+    print(f"  Running inference on {video_uri.split('/')[-1] if video_uri else 'cached video'} (async)...")
+    response = await model.generate_content_async(
+        build_contents(video_uri, prompt, window),
+        generation_config=make_generation_config(generation_config),
+        stream=stream,
     )
-    args = parser.parse_args()
-    
-    # Select prompts based on arguments
-    def get_prompt(prompt_type: str):
-        if prompt_type == "granular":
-            return GRANULAR_TIMESTAMP_PROMPT
-        elif prompt_type == "numbered":
-            return NUMBERED_LIST_PROMPT
-        else:
-            return DEFAULT_PROMPT
+    if not stream:
+        return response
+    chunks = []
+    async for chunk in response:
+        timing.setdefault("first_byte", time.perf_counter())
+        chunks.append(chunk)
+    return StreamedResponse(chunks)
+
+
+def count_steps(result: Dict[str, Any]) -> int:
+    """Count the steps in a parsed output, whatever its format."""
+    if result.get("format") == "numbered_list":
+        # Count lines that start with numbers
+        lines = result.get("steps", "").strip().split('\n')
+        return sum(1 for line in lines if line.strip() and line.strip()[0].isdigit())
+    return len(result.get("cutSegments", []))
+
+
+def write_json(path: Path, data: Dict[str, Any]):
+    """Write a JSON output file."""
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+
+
+class ResponseCache:
+    """Content-addressed on-disk cache of model response text.
     
-    model1_prompt = get_prompt(args.model1_prompt)
-    model2_prompt = get_prompt(args.model2_prompt)
+    Entries are keyed by a hash of the model id, prompt, generation config and
+    the video blob's URI, generation and crc32c, so a new upload of a video
+    (or any change to the request) is a miss. The cache is bounded to
+    max_bytes; when it grows past that, least recently used entries (by file
+    mtime, which is bumped on every hit) are evicted down to CACHE_LOW_WATER
+    of the budget, so the directory is scanned once per batch of evictions
+    rather than on every write of a full cache.
+    """
     
-    print("=" * 80)
-    print("Gemini Model Comparison - Video Inference")
-    print("=" * 80)
-    print(f"Project: {PROJECT_ID}")
-    print(f"Location: {LOCATION}")
-    print(f"GCS Path: {args.gcs_path}")
-    print()
-    print(f"Model 1 ({args.model1_name}): {args.model1}")
-    if args.model1_no_prompt:
-        print(f"  Prompt: NO")
-    else:
-        print(f"  Prompt: {args.model1_prompt.upper()}")
-    print(f"Model 2 ({args.model2_name}): {args.model2}")
-    if args.model2_no_prompt:
-        print(f"  Prompt: NO")
-    else:
-        print(f"  Prompt: {args.model2_prompt.upper()}")
-    print()
+    def __init__(self, cache_dir: Path, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.total_bytes = sum(path.stat().st_size for path in self.cache_dir.glob("*/*.json"))
     
-    # List videos
-    video_uris = list_videos_from_gcs(args.gcs_path)
-    if not video_uris:
-        print("ERROR: No videos found!")
-        sys.exit(1)
+    def key_for(self, task: Dict[str, Any]) -> str:
+        """Cache key for a task, or None if the video's blob identity is unknown."""
+        video = VIDEO_METADATA.get(task["video_uri"], {})
+        if not video.get("generation") or not video.get("crc32c"):
+            return None
+        key_fields = {
+            "model_id": task["model_id"],
+            "prompt_sha256": prompt_sha256(task["prompt"]),
+            "generation_config": task.get("generation_config") or {},
+            "video_uri": task["video_uri"],
+            "video_generation": str(video["generation"]),
+            "video_crc32c": video["crc32c"],
+        }
+        if task.get("window"):
+            key_fields["window"] = list(task["window"])
+        if task.get("request_uri"):
+            key_fields["request_uri"] = task["request_uri"]
+        return hashlib.sha256(json.dumps(key_fields, sort_keys=True).encode()).hexdigest()
     
-    print()
-    print("-" * 80)
-    print("Initializing models...")
-    print("-" * 80)
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
     
-    def load_model(model_id: str, model_name: str):
-        """Load a model with error handling."""
-        print(f"Loading {model_name}: {model_id}...")
-        
-        # Check if it's a base model name or an endpoint
-        if model_id.startswith("gemini-"):
-            return GenerativeModel(model_id)
-        
-        # Try different endpoint formats
+    def get(self, key: str) -> Dict[str, Any]:
+        """Cached entry ("text", plus "candidates" if several) for a key, or None on a miss."""
+        if key is None:
+            self.bypassed += 1
+            return None
+        path = self._path(key)
         try:
-            # Format 1: Direct endpoint reference
-            return GenerativeModel(
-                f"projects/{PROJECT_ID}/locations/{LOCATION}/endpoints/{model_id}"
-            )
-        except Exception as e:
-            print(f"  Format 1 failed: {e}")
-            try:
-                # Format 2: Just the endpoint ID
-                return GenerativeModel(model_id)
-            except Exception as e2:
-                print(f"  Format 2 failed: {e2}")
-                print(f"  ERROR: Could not initialize {model_name}")
-                sys.exit(1)
+            with open(path) as f:
+                entry = json.load(f)
+            os.utime(path)
+        except (OSError, json.JSONDecodeError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
     
-    model1 = load_model(args.model1, args.model1_name)
-    model2 = load_model(args.model2, args.model2_name)
+    def put(self, key: str, text: str, task: Dict[str, Any], candidates: List[str] = None):
+        """Store response text for a key, evicting old entries if over budget."""
+        if key is None:
+            return
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        write_json(tmp_path, {
+            "text": text,
+            "candidates": candidates,
+            "model_id": task["model_id"],
+            "video_uri": task["video_uri"],
+            "prompt_type": task["prompt_type"],
+            "created": datetime.now().isoformat(),
+        })
+        previous = path.stat().st_size if path.exists() else 0
+        os.replace(tmp_path, path)
+        self.total_bytes += path.stat().st_size - previous
+        if self.total_bytes > self.max_bytes:
+            self.evict()
     
-    print()
-    print("-" * 80)
-    print(f"Running inference on {len(video_uris)} videos IN PARALLEL...")
-    print("-" * 80)
+    def evict(self):
+        """Delete least recently used entries until the cache is down to its low-water mark."""
+        target = self.max_bytes * CACHE_LOW_WATER
+        entries = sorted(self.cache_dir.glob("*/*.json"), key=lambda p: p.stat().st_mtime)
+        for path in entries:
+            if self.total_bytes <= target:
+                break
+            size = path.stat().st_size
+            path.unlink()
+            self.total_bytes -= size
+            self.evictions += 1
+
+
+class VideoContextCache:
+    """Vertex cached content holding a video, shared by every prompt asked about it.
     
-    def process_video_with_model(video_uri: str, model: GenerativeModel, model_name: str, prompt: str, prompt_type: str):
-        """Process a single video with a single model."""
-        video_name = video_uri.split('/')[-1].rsplit('.', 1)[0]
-        output_path = JSON_OUTPUT_DIR / f"{video_name}_{model_name}.json"
-        
-        prompt_status = "no prompt" if prompt is None else f"with {prompt_type} prompt"
-        print(f"[{model_name.upper()}] Starting {video_name} ({prompt_status})...")
+    When several tasks ask the same model about the same video (a prompt
+    sweep), the first call puts the video into a CachedContent and the rest
+    send only their prompt against it. The cached content is deleted once the
+    last of those tasks finishes, or expires after ttl_seconds if the run dies.
+    Only base gemini-* models support context caching, and tasks without a
+    prompt or with a window keep sending the video inline.
+    """
+    
+    def __init__(self, tasks: List[Dict[str, Any]], ttl_seconds: float = 1800):
+        self.ttl_seconds = ttl_seconds
+        self.remaining: Dict[Tuple[str, str], int] = {}
+        for task in tasks:
+            if self.eligible(task):
+                key = self.key_for(task)
+                self.remaining[key] = self.remaining.get(key, 0) + 1
+        # A video asked only once gains nothing from caching
+        self.remaining = {key: count for key, count in self.remaining.items() if count > 1}
+        self.contexts: Dict[Tuple[str, str], Any] = {}
+        self.locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+        self.created = 0
+        self.reused = 0
+        self.failed = 0
+        self.create_latency = 0.0
+    
+    @staticmethod
+    def key_for(task: Dict[str, Any]) -> Tuple[str, str]:
+        return (task.get("request_uri") or task["video_uri"], task["model_id"])
+    
+    @staticmethod
+    def eligible(task: Dict[str, Any]) -> bool:
+        return task["model_id"].startswith("gemini-") and task["prompt"] is not None and not task.get("window")
+    
+    def shares(self, task: Dict[str, Any]) -> bool:
+        return self.eligible(task) and self.key_for(task) in self.remaining
+    
+    def _create(self, video_uri: str, model_id: str):
+        from vertexai.preview import caching
         
-        try:
-            expect_json = prompt_type != "numbered"
-            result = run_inference(model, video_uri, prompt, expect_json)
-            with open(output_path, 'w') as f:
-                json.dump(result, f, indent=2)
-            
-            # Count segments differently based on format
-            if result.get("format") == "numbered_list":
-                # Count lines that start with numbers
-                lines = result.get("steps", "").strip().split('\n')
-                segments = sum(1 for line in lines if line.strip() and line.strip()[0].isdigit())
+        cached_content = caching.CachedContent.create(
+            model_name=model_id,
+            contents=[Part.from_uri(video_uri, mime_type="video/mp4")],
+            ttl=timedelta(seconds=self.ttl_seconds),
+            display_name=f"{video_name_from_uri(video_uri)}_{model_id}"[:128],
+        )
+        return cached_content, GenerativeModel.from_cached_content(cached_content=cached_content)
+    
+    async def model_for(self, task: Dict[str, Any]) -> GenerativeModel:
+        """Model bound to the task's cached video, creating it on first use (None if unavailable)."""
+        key = self.key_for(task)
+        async with self.locks.setdefault(key, asyncio.Lock()):
+            if key in self.contexts:
+                if self.contexts[key] is not None:
+                    self.reused += 1
             else:
-                segments = len(result.get("cutSegments", []))
-            
-            print(f"[{model_name.upper()}] ✓ {video_name}: {segments} steps")
-            return (video_name, model_name, segments, None)
-        except Exception as e:
-            print(f"[{model_name.upper()}] ✗ {video_name}: {str(e)}")
-            error_result = {"error": str(e)}
-            with open(output_path, 'w') as f:
-                json.dump(error_result, f, indent=2)
-            return (video_name, model_name, 0, str(e))
+                start = time.perf_counter()
+                try:
+                    self.contexts[key] = await asyncio.to_thread(self._create, *key)
+                    self.created += 1
+                    self.create_latency += time.perf_counter() - start
+                except Exception as e:
+                    print(f"  ✗ Context cache for {video_name_from_uri(key[0])} on {key[1]} failed ({e}); sending the video inline")
+                    self.contexts[key] = None
+                    self.failed += 1
+        context = self.contexts[key]
+        return context[1] if context else None
     
-    # Create all tasks (video x model combinations)
-    tasks = []
-    for video_uri in video_uris:
-        prompt1 = None if args.model1_no_prompt else model1_prompt
-        prompt2 = None if args.model2_no_prompt else model2_prompt
-        prompt1_type = "none" if args.model1_no_prompt else args.model1_prompt
-        prompt2_type = "none" if args.model2_no_prompt else args.model2_prompt
-        tasks.append((video_uri, model1, args.model1_name, prompt1, prompt1_type))
-        tasks.append((video_uri, model2, args.model2_name, prompt2, prompt2_type))
+    async def release(self, task: Dict[str, Any]):
+        """Mark a task finished; deletes the cached content after the video's last task."""
+        if not self.shares(task):
+            return
+        key = self.key_for(task)
+        self.remaining[key] -= 1
+        context = self.contexts.pop(key, None) if self.remaining[key] == 0 else None
+        if context:
+            try:
+                await asyncio.to_thread(context[0].delete)
+            except Exception as e:
+                print(f"  WARNING: Could not delete cached content for {video_name_from_uri(key[0])} ({e}); it expires on its own")
+
+
+class AIMDController:
+    """Adaptive in-flight request limit for a single model endpoint.
     
-    # Run all tasks in parallel
-    results = []
-    with ThreadPoolExecutor(max_workers=20) as executor:
-        futures = {
-            executor.submit(process_video_with_model, video_uri, model, model_name, prompt, prompt_type): (video_uri, model_name)
-            for video_uri, model, model_name, prompt, prompt_type in tasks
-        }
-        
-        for future in as_completed(futures):
-            result = future.result()
-            results.append(result)
+    The limit grows additively (by ~1 per window of successful calls) and is
+    halved when the endpoint throttles us. Only one decrease is applied per
+    window: throttles from requests that started before the last decrease
+    reflect the old limit and are ignored. With adaptive=False it behaves as a
+    plain fixed-size semaphore.
+    """
     
-    # Print summary
-    print()
-    print("-" * 80)
-    print("Summary by video:")
-    print("-" * 80)
+    def __init__(self, name: str, initial: int, maximum: int, minimum: int = 1,
+                 increase: float = 1.0, decrease: float = 0.5, adaptive: bool = True):
+        self.name = name
+        self.maximum = maximum
+        self.minimum = minimum
+        self.increase = increase
+        self.decrease = decrease
+        self.adaptive = adaptive
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.peak_limit = self.limit
+        self.in_flight = 0
+        self.successes = 0
+        self.throttles = 0
+        self._last_decrease = 0.0
+        self._cond = asyncio.Condition()
     
-    video_names = sorted(set(r[0] for r in results))
-    for video_name in video_names:
-        model1_result = next((r for r in results if r[0] == video_name and r[1] == args.model1_name), None)
-        model2_result = next((r for r in results if r[0] == video_name and r[1] == args.model2_name), None)
-        
-        model1_status = f"{model1_result[2]} segments" if model1_result and not model1_result[3] else f"ERROR: {model1_result[3]}" if model1_result else "N/A"
-        model2_status = f"{model2_result[2]} segments" if model2_result and not model2_result[3] else f"ERROR: {model2_result[3]}" if model2_result else "N/A"
-        
-        print(f"  {video_name}:")
-        print(f"    {args.model1_name}: {model1_status}")
-        print(f"    {args.model2_name}: {model2_status}")
+    async def acquire(self) -> float:
+        """Wait for a free slot; returns the start time to pass to release()."""
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+            return time.monotonic()
     
-    print()
-    print("=" * 80)
-    print("✓ Inference complete!")
-    print(f"  Output directory: {OUTPUT_DIR}")
-    print(f"  JSON outputs saved to: {JSON_OUTPUT_DIR}")
-    print()
-    print("Next steps:")
-    print(f"  1. Run: python create_subtitles.py {OUTPUT_DIR}")
-    print(f"  2. Run: python burn_subtitles.py {OUTPUT_DIR}")
-    print("=" * 80)
+    async def release(self, started: float, throttled: bool = False):
+        """Free a slot and adjust the limit based on how the call went."""
+        async with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.throttles += 1
+                if self.adaptive and started >= self._last_decrease:
+                    self.limit = max(self.minimum, self.limit * self.decrease)
+                    self._last_decrease = time.monotonic()
+                    print(f"[{self.name.upper()}] Throttled, concurrency limit -> {int(self.limit)}")
+            else:
+                self.successes += 1
+                if self.adaptive:
+                    self.limit = min(self.maximum, self.limit + self.increase / self.limit)
+                    self.peak_limit = max(self.peak_limit, self.limit)
+            self._cond.notify_all()
+
+
+def is_throttle_error(error: Exception) -> bool:
+    """Whether an exception is a quota / rate-limit rejection (HTTP 429).
+    
+    Decided by the error's type or status code only; the message can contain
+    "429" for unrelated reasons (e.g. a file name).
+    """
+    return isinstance(error, (ResourceExhausted, TooManyRequests)) or getattr(error, "code", None) == 429
+
+
+async def call_model(task: Dict[str, Any], engine: Dict[str, Any], timing: Dict[str, float] = None):
+    """Make one inference call for a task on the selected engine and return the raw response.
+    
+    The request goes to task["request_uri"] (e.g. a low-res proxy) if set,
+    otherwise to the task's video itself, unless engine["contexts"] holds the
+    video in cached content. timing is filled in as described in
+    generate_response().
+    """
+    model, video_uri = task["model"], task.get("request_uri") or task["video_uri"]
+    contexts = engine.get("contexts")
+    if contexts and contexts.shares(task):
+        shared = await contexts.model_for(task)
+        if shared is not None:
+            model, video_uri = shared, None
+            task["context_cached"] = True
+    args = (
+        model, video_uri, task["prompt"],
+        task.get("window"), task.get("generation_config"), engine.get("stream", False), timing,
+    )
+    if engine["name"] == "async":
+        return await generate_response_async(*args)
+    loop = asyncio.get_running_loop()
+    future = engine["executor"].submit(generate_response, *args)
+    slots = engine.get("pool_slots")
+    if slots:
+        # The pool slot taken in fetch_response_text() is freed when the thread
+        # returns, not when the call is abandoned at its deadline (the thread
+        # keeps its pool worker until generate_content comes back)
+        future.add_done_callback(lambda _: release_threadsafe(loop, slots))
+        if timing is not None:
+            timing["in_pool"] = True
+    return await asyncio.wrap_future(future)
+
+
+def release_threadsafe(loop: asyncio.AbstractEventLoop, semaphore: asyncio.Semaphore):
+    """Release an asyncio semaphore from a worker thread."""
+    try:
+        loop.call_soon_threadsafe(semaphore.release)
+    except RuntimeError:
+        pass  # The run is over and its loop closed; nobody waits for the slot
+
+
+def estimate_video_duration(video_uri: str) -> float:
+    """Best-effort video duration in seconds (None if unknown).
+    
+    Uses an explicit "duration" if one has been recorded for the video,
+    otherwise estimates it from the blob size at ASSUMED_VIDEO_BITRATE_MBPS.
+    """
+    metadata = VIDEO_METADATA.get(video_uri, {})
+    if metadata.get("duration"):
+        return float(metadata["duration"])
+    if metadata.get("size"):
+        return metadata["size"] * 8 / (ASSUMED_VIDEO_BITRATE_MBPS * 1_000_000)
+    return None
+
+
+def request_deadline(task: Dict[str, Any], policy: Dict[str, Any]) -> float:
+    """Per-call deadline in seconds, scaled by the duration of video sent."""
+    if task.get("window"):
+        duration = task["window"][1] - task["window"][0]
+    else:
+        duration = estimate_video_duration(task["video_uri"]) or 0.0
+    deadline = policy["deadline_base"] + policy["deadline_per_second"] * duration
+    return min(deadline, policy["deadline_max"])
+
+
+def backoff_delay(attempt: int, policy: Dict[str, Any]) -> float:
+    """Exponential backoff with full jitter before retry number `attempt` (1-based)."""
+    ceiling = min(policy["backoff_max"], policy["backoff_base"] * 2 ** (attempt - 1))
+    return random.uniform(0, ceiling)
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Whether a failed call should be retried."""
+    return isinstance(error, RETRYABLE_ERRORS) or is_throttle_error(error)
+
+
+def plan_windows(duration: float, chunk_seconds: float, overlap: float) -> List[Tuple[float, float]]:
+    """Split [0, duration] into windows of chunk_seconds that overlap by `overlap`."""
+    if not 0 <= overlap < chunk_seconds:
+        raise ValueError(f"overlap ({overlap}) must be at least 0 and less than chunk_seconds ({chunk_seconds})")
+    windows = []
+    start = 0.0
+    while True:
+        end = min(duration, start + chunk_seconds)
+        windows.append((round(start, 3), round(end, 3)))
+        if end >= duration:
+            return windows
+        # Rounding must not leave the next window starting where this one did
+        start = max(end - overlap, start + 0.001)
+
+
+def merge_window_segments(window_results: List[Dict[str, Any]], windows: List[Tuple[float, float]],
+                          precise: bool = False) -> List[Dict[str, Any]]:
+    """Merge per-window cutSegments onto the global timeline.
+    
+    Window timestamps are shifted by the window start unless the model already
+    answered in absolute video time (detected by timestamps running past the
+    window length). Adjacent windows share an overlap, so each window only
+    keeps the segments whose midpoint falls in the part of the timeline it
+    owns: from the middle of the overlap with the previous window to the middle
+    of the overlap with the next one. Segments seen by both windows around a
+    boundary are therefore kept once.
+    """
+    merged = []
+    for i, (result, (start, end)) in enumerate(zip(window_results, windows)):
+        owned_from = 0.0 if i == 0 else (start + windows[i - 1][1]) / 2
+        owned_to = float("inf") if i == len(windows) - 1 else (windows[i + 1][0] + end) / 2
+        
+        segments = []
+        for segment in result.get("cutSegments", []):
+            try:
+                segments.append((parse_timestamp(segment["start"]), parse_timestamp(segment["end"]), segment))
+            except (KeyError, ValueError):
+                continue
+        already_absolute = start > 0 and any(seg_end > (end - start) + 1.0 for _, seg_end, _ in segments)
+        offset = 0.0 if already_absolute else start
+        
+        for seg_start, seg_end, segment in segments:
+            seg_start, seg_end = seg_start + offset, seg_end + offset
+            midpoint = (seg_start + seg_end) / 2
+            if owned_from <= midpoint < owned_to:
+                merged.append(dict(
+                    segment,
+                    start=format_timestamp(seg_start, precise),
+                    end=format_timestamp(seg_end, precise),
+                    _start_s=seg_start,
+                ))
+    
+    merged.sort(key=lambda s: s["_start_s"])
+    for segment in merged:
+        del segment["_start_s"]
+    return merged
+
+
+def raw_record(task: Dict[str, Any], responses: List[Dict[str, Any]], error: str = None,
+               inference: Dict[str, Any] = None) -> Dict[str, Any]:
+    """The raw/ record of a task: every response as returned, before any parsing.
+    
+    responses holds one entry per window (or a single entry) with the final
+    text plus the calls made for it, each with its text, token usage, finish
+    reason and latency.
+    """
+    return {
+        "video_uri": task["video_uri"],
+        "model_name": task["model_name"],
+        "model_id": task["model_id"],
+        "prompt_type": task["prompt_type"],
+        "windows": [list(window) for window in task["windows"]] if task.get("windows") else None,
+        "responses": responses,
+        "error": error,
+        "inference": inference or {},
+    }
+
+
+def parse_texts(raw: Dict[str, Any], texts: List[str]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Parse one response text per window (or a single text) into an output.
+    
+    Returns the output and the individual parsed responses.
+    """
+    expect_json = raw["prompt_type"] != "numbered"
+    windows = raw.get("windows")
+    if not windows:
+        result = parse_response_text(texts[0], expect_json)
+        return result, [result]
+    parsed = [parse_response_text(text, expect_json) for text in texts]
+    result = {
+        "cutSegments": merge_window_segments(parsed, windows, precise=raw["prompt_type"] == "granular"),
+        "chunks": [
+            {"start": start, "end": end, "segments": len(r.get("cutSegments", [])), **({"error": r["error"]} if "error" in r else {})}
+            for r, (start, end) in zip(parsed, windows)
+        ],
+    }
+    return result, parsed
+
+
+def build_output(raw: Dict[str, Any]) -> Tuple[Dict[str, Any], str]:
+    """Parse a task's raw record into its output JSON; returns (result, parse_error).
+    
+    This is the only place response text is turned into cutSegments /
+    numbered_list output, so parse_outputs.py can rebuild json/ from raw/
+    without calling the models again.
+    """
+    inference = dict(raw.get("inference") or {})
+    inference.pop("parse_error", None)
+    if raw.get("error"):
+        return {"error": raw["error"], "inference": inference}, None
+    
+    result, parsed = parse_texts(raw, [response["text"] for response in raw["responses"]])
+    
+    # With candidate_count > 1 the first candidate is the output and all of
+    # them are kept alongside; window i's candidate k belongs to candidate k
+    count = len(raw["responses"][0].get("candidates") or [])
+    if count > 1:
+        candidates = [
+            parse_texts(raw, [response["candidates"][k] for response in raw["responses"]])[0]
+            for k in range(count)
+        ]
+        result["candidates"] = candidates
+        result["candidate_summary"] = candidate_summary(candidates)
+    
+    expect_json = raw["prompt_type"] != "numbered"
+    parse_error = None
+    if expect_json:
+        parse_error = next((problem for problem in map(validate_result, parsed) if problem), None)
+        if parse_error:
+            inference["parse_error"] = parse_error
+    result["inference"] = inference
+    return result, parse_error
+
+
+def save_task_output(task: Dict[str, Any], engine: Dict[str, Any], output_path: Path,
+                     result: Dict[str, Any], error: str = None, raw: Dict[str, Any] = None,
+                     **stats) -> Dict[str, Any]:
+    """Write a task's output JSON, record it in the manifest and build its result summary.
+    
+    If given, the task's raw record is written to raw/ next to json/, with the
+    same inference block as the output. An output whose response still
+    couldn't be parsed (a parse_error in stats) is written for inspection but
+    recorded as failed, so --resume requests it again.
+    """
+    if stats.get("parse_error") and not error:
+        error = f"Unparsed response: {stats['parse_error']}"
+    if task.get("request_uri"):
+        result.setdefault("inference", {})["request_uri"] = task["request_uri"]
+    if task.get("profile"):
+        result.setdefault("inference", {})["profile"] = task["profile"]
+    if task.get("context_cached"):
+        result.setdefault("inference", {})["context_cached"] = True
+    if task.get("generation_config"):
+        result.setdefault("inference", {})["generation_config"] = task["generation_config"]
+    write_json(output_path, result)
+    if raw is not None:
+        raw["inference"] = {k: v for k, v in result.get("inference", {}).items() if k != "parse_error"}
+        raw_dir = engine["run_dir"] / RAW_DIR
+        raw_dir.mkdir(exist_ok=True)
+        write_json(raw_dir / output_path.name, raw)
+    manifest = engine["manifest"]
+    if manifest and task.get("manifest_key"):
+        manifest.update(
+            task["manifest_key"], "failed" if error else "done",
+            output=f"json/{output_path.name}", error=error,
+        )
+    summary = {
+        "video_uri": task["video_uri"],
+        "video_name": video_name_from_uri(task["video_uri"]),
+        "model_name": task["model_name"],
+        "prompt_type": task["prompt_type"],
+        "output": output_path.name,
+        "segments": 0 if error else count_steps(result),
+        "error": error,
+        "latency": 0.0,
+        "attempts": 0,
+        "retry_latency": 0.0,
+        "cached": False,
+        "invalid_responses": 0,
+        "parse_error": None,
+    }
+    summary.update(stats)
+    return summary
+
+
+async def fetch_response_text(task: Dict[str, Any], engine: Dict[str, Any]) -> Dict[str, Any]:
+    """Get the response text for one request, from the cache or from Vertex.
+    
+    With the "threads" engine the blocking generate_content call runs on the
+    shared thread pool (one thread per in-flight request); with the "async"
+    engine it is awaited directly. In both cases the per-model controller in
+    engine["limiters"] (if any) bounds how many calls are in flight, and
+    throttles are reported back to it.
+    
+    Each call gets a deadline that scales with the duration of video sent,
+    counted from when the call starts (on the threads engine, once a pool
+    thread is free); calls that run past it are cancelled (on the threads
+    engine the worker thread is abandoned rather than interrupted, and its
+    pool slot stays taken until it finishes). Retryable errors and
+    timeouts are retried with exponential backoff and jitter, up to
+    max_attempts calls. Returns the text (or error) plus call stats, and
+    "calls": every call made with its text or error, token usage, finish
+    reason and latency. Every call (and cache hit) is also logged to the run's
+    metrics.jsonl, with how long it waited for a concurrency slot or pool
+    thread and, when streaming, its time to first byte. "latency" covers only
+    the call itself, not that wait.
+    
+    Timestamped responses are parsed and validated as they arrive. An invalid
+    one is requested again up to policy["invalid_retries"] times; if it is
+    still invalid it is returned (and saved with its parse error) but not
+    cached. "invalid" counts the invalid responses received.
+    """
+    model_name = task["model_name"]
+    label = task.get("label", video_name_from_uri(task["video_uri"]))
+    expect_json = task["prompt_type"] != "numbered"
+    
+    cache = engine["cache"]
+    cache_key = cache.key_for(task) if cache else None
+    if cache:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            log_call_metrics(engine["run_dir"], task, {"attempt": 0, "cached": True})
+            return {
+                "text": cached["text"], "candidates": cached.get("candidates"), "error": None, "cached": True,
+                "attempts": 0, "latency": 0.0, "retry_latency": 0.0, "invalid": 0, "calls": [],
+            }
+    
+    prompt_status = "no prompt" if task["prompt"] is None else f"with {task['prompt_type']} prompt"
+    manifest = engine["manifest"]
+    manifest_key = task.get("manifest_key")
+    limiter = engine["limiters"].get(model_name)
+    policy = engine["retry"]
+    deadline = request_deadline(task, policy)
+    first_start = time.perf_counter()
+    attempt = 0
+    invalid = 0
+    calls = []
+    
+    while True:
+        attempt += 1
+        queued = time.perf_counter()
+        started = await limiter.acquire() if limiter else None
+        throttled = False
+        if manifest and manifest_key:
+            manifest.update(manifest_key, "running", attempts=manifest.tasks[manifest_key]["attempts"] + 1)
+        print(f"[{model_name.upper()}] Starting {label} ({prompt_status}, attempt {attempt})...")
+        start = time.perf_counter()
+        retry_latency = start - first_start
+        stats = {"cached": False, "attempts": attempt, "retry_latency": retry_latency, "deadline": deadline}
+        timing = {}
+        call = {"attempt": attempt}
+        calls.append(call)
+        pool_slots = engine.get("pool_slots")
+        holding_slot = False
+        try:
+            # On the threads engine, wait for a free pool thread before the
+            # deadline starts, so time queued behind other calls doesn't count
+            if pool_slots:
+                await pool_slots.acquire()
+                holding_slot = True
+            response = await asyncio.wait_for(call_model(task, engine, timing), timeout=deadline)
+            stats["latency"] = time.perf_counter() - timing["started"]
+            call.update(response_details(response))
+            texts = candidate_texts(response)
+            call["text"] = text = texts[0]
+            candidates = call["candidates"] = texts if len(texts) > 1 else None
+            problem = validate_result(parse_response_text(text, expect_json)) if expect_json else None
+            if problem:
+                invalid += 1
+                if invalid <= policy["invalid_retries"] and attempt < policy["max_attempts"]:
+                    print(f"[{model_name.upper()}] ↻ {label}: invalid response ({problem}) - requesting again")
+                    continue
+            elif cache:
+                cache.put(cache_key, text, task, candidates)
+            return dict(stats, text=text, candidates=candidates, error=None, invalid=invalid, calls=calls)
+        except Exception as e:
+            # The call failed before it was sent (e.g. while creating cached content)
+            timing.setdefault("started", time.perf_counter())
+            stats["latency"] = time.perf_counter() - timing["started"]
+            throttled = limiter is not None and is_throttle_error(e)
+            error = call["error"] = f"Deadline of {deadline:.0f}s exceeded" if isinstance(e, asyncio.TimeoutError) else str(e)
+            if is_retryable_error(e) and attempt < policy["max_attempts"]:
+                delay = backoff_delay(attempt, policy)
+                print(f"[{model_name.upper()}] ↻ {label}: {error} - retrying in {delay:.1f}s ({attempt}/{policy['max_attempts']})")
+            else:
+                return dict(stats, text=None, candidates=None, error=error, invalid=invalid, calls=calls)
+        finally:
+            if holding_slot and not timing.get("in_pool"):
+                pool_slots.release()
+            # Cancelled before the call was sent, the call hasn't started or taken any time
+            call_start = timing.get("started", time.perf_counter())
+            call["queue_wait_s"] = round(call_start - queued, 3)
+            call["ttfb_s"] = round(timing["first_byte"] - call_start, 3) if "first_byte" in timing else None
+            call["latency_s"] = round(stats.get("latency", time.perf_counter() - call_start), 3)
+            log_call_metrics(engine["run_dir"], task, call)
+            if limiter:
+                await limiter.release(started, throttled)
+        # Back off outside the limiter so the slot is free for other tasks
+        await asyncio.sleep(delay)
+
+
+def log_call_metrics(run_dir: Path, task: Dict[str, Any], call: Dict[str, Any]):
+    """Append one call's timings, token usage and outcome to the run's metrics.jsonl."""
+    usage = call.get("usage") or {}
+    record = {
+        "time": datetime.now().isoformat(),
+        "video_name": video_name_from_uri(task["video_uri"]),
+        "model_name": task["model_name"],
+        "prompt_type": task["prompt_type"],
+        "profile": task.get("profile", "default"),
+        "window": list(task["window"]) if task.get("window") else None,
+        "cached": call.get("cached", False),
+        "attempt": call["attempt"],
+        "retries": max(call["attempt"] - 1, 0),
+        "queue_wait_s": call.get("queue_wait_s", 0.0),
+        "ttfb_s": call.get("ttfb_s"),
+        "latency_s": call.get("latency_s", 0.0),
+        "prompt_tokens": usage.get("prompt_tokens", 0),
+        "output_tokens": usage.get("output_tokens", 0),
+        "thinking_tokens": usage.get("thinking_tokens", 0),
+        "total_tokens": usage.get("total_tokens", 0),
+        "finish_reason": call.get("finish_reason"),
+        "error": call.get("error"),
+    }
+    with open(run_dir / METRICS_FILE, 'a') as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def inference_stats(fetch: Dict[str, Any]) -> Dict[str, Any]:
+    """The per-output "inference" block for a fetch result."""
+    if fetch["cached"]:
+        return {"cache": "hit", "attempts": 0}
+    return {
+        "attempts": fetch["attempts"],
+        "retry_latency_s": round(fetch["retry_latency"], 3),
+        "latency_s": round(fetch["latency"], 3),
+        "deadline_s": round(fetch["deadline"], 1),
+    }
+
+
+async def process_task(task: Dict[str, Any], engine: Dict[str, Any]) -> Dict[str, Any]:
+    """Process a single (video, model) task and save its JSON output.
+    
+    Tasks with "windows" are chunked: every (start, end) window is requested
+    concurrently and the windows' cutSegments are merged back onto the video's
+    timeline. The responses are kept unparsed in raw/ alongside the output.
+    """
+    model_name = task["model_name"]
+    video_name = video_name_from_uri(task["video_uri"])
+    output_name = task.get("output_name") or f"{video_name}_{model_name}"
+    output_path = engine["run_dir"] / "json" / f"{output_name}.json"
+    windows = task.get("windows")
+    
+    if windows:
+        fetches = await asyncio.gather(*(
+            fetch_response_text(dict(task, window=window, label=f"{video_name} [{window[0]:.0f}-{window[1]:.0f}s]"), engine)
+            for window in windows
+        ))
+    else:
+        fetches = [await fetch_response_text(task, engine)]
+    
+    stats = {
+        "cached": all(f["cached"] for f in fetches),
+        "invalid_responses": sum(f["invalid"] for f in fetches),
+        "attempts": sum(f["attempts"] for f in fetches),
+        "latency": max(f["latency"] for f in fetches),
+        "retry_latency": max(f["retry_latency"] for f in fetches),
+    }
+    responses = [
+        {
+            "window": list(window) if window else None, "text": f["text"], "candidates": f["candidates"],
+            "error": f["error"], "cached": f["cached"], "calls": f["calls"],
+        }
+        for f, window in zip(fetches, windows or [None])
+    ]
+    errors = [f["error"] for f in fetches if f["error"]]
+    if errors:
+        error = errors[0] if not windows else f"{len(errors)}/{len(windows)} windows failed: {errors[0]}"
+        print(f"[{model_name.upper()}] ✗ {video_name}: {error}")
+        raw = raw_record(task, responses, error, inference_stats(next(f for f in fetches if f["error"])))
+        result, _ = build_output(raw)
+        return save_task_output(task, engine, output_path, result, error=error, raw=raw, **stats)
+    
+    if windows:
+        inference = {
+            "windows": len(windows),
+            "attempts": stats["attempts"],
+            "retry_latency_s": round(stats["retry_latency"], 3),
+            "latency_s": round(stats["latency"], 3),
+        }
+    else:
+        inference = inference_stats(fetches[0])
+    if stats["invalid_responses"]:
+        inference["invalid_responses"] = stats["invalid_responses"]
+    raw = raw_record(task, responses, inference=inference)
+    result, stats["parse_error"] = build_output(raw)
+    
+    summary = save_task_output(task, engine, output_path, result, raw=raw, **stats)
+    if summary["error"]:
+        print(f"[{model_name.upper()}] ✗ {video_name}: {summary['error']}")
+        return summary
+    suffix = "cached" if stats["cached"] else f"{stats['latency']:.1f}s" + (f", {len(windows)} windows" if windows else "")
+    if "candidate_summary" in result:
+        spread = result["candidate_summary"]
+        suffix += f", {spread['count']} candidates: {spread.get('min', 0)}-{spread.get('max', 0)} steps"
+    print(f"[{model_name.upper()}] ✓ {video_name}: {summary['segments']} steps ({suffix})")
+    return summary
+
+
+async def run_tasks(tasks: List[Dict[str, Any]], run_dir: Path, engine_name: str, workers: int,
+                    concurrency: Dict[str, int], adaptive: bool = False,
+                    adaptive_start: int = 4,
+                    retry_policy: Dict[str, Any] = None,
+                    manifest: TaskManifest = None,
+                    cache: ResponseCache = None,
+                    stream: bool = False,
+                    contexts: VideoContextCache = None,
+                    queue: WorkQueue = None) -> Tuple[List[Dict[str, Any]], Dict[str, AIMDController]]:
+    """Run all tasks on the selected engine, writing outputs under run_dir/json.
+    
+    If a manifest is given, each task's "manifest_key" is used to record its
+    state transitions so the run can be resumed later. If a cache is given,
+    cached responses are re-used and new ones are stored. With stream=True
+    responses are streamed so each call's time to first byte is recorded. With
+    contexts, tasks sharing a video on a model reuse one cached content.
+    
+    With a queue, tasks are not all dispatched at once: each free slot (pool
+    thread, or in-flight request for the async engine) claims the next task
+    from the shared queue, so several worker processes split the run between
+    them. Only tasks claimed by this process are in the returned results.
+    
+    Returns the task results and the per-model concurrency controllers. The
+    async engine always gets a controller per model (fixed-size unless
+    adaptive); the threads engine is bounded by its pool and only gets
+    controllers in adaptive mode, capped at the pool size.
+    """
+    engine = {
+        "name": engine_name,
+        "run_dir": run_dir,
+        "manifest": manifest,
+        "cache": cache,
+        "executor": None,
+        "limiters": {},
+        "retry": retry_policy or DEFAULT_RETRY_POLICY,
+        "stream": stream,
+        "contexts": contexts,
+    }
+    if engine_name == "async" or adaptive:
+        for model_name, limit in concurrency.items():
+            maximum = limit if engine_name == "async" else min(limit, workers)
+            engine["limiters"][model_name] = AIMDController(
+                model_name,
+                initial=adaptive_start if adaptive else maximum,
+                maximum=maximum,
+                adaptive=adaptive,
+            )
+    
+    async def run_task(task: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            return await process_task(task, engine)
+        finally:
+            if contexts:
+                await contexts.release(task)
+    
+    async def run_queue(slots: int) -> List[Dict[str, Any]]:
+        by_key = {task["manifest_key"]: task for task in tasks}
+        results = []
+        poll_interval = min(5.0, queue.lease_seconds / 3)
+        
+        async def heartbeat():
+            while True:
+                await asyncio.sleep(queue.lease_seconds / 3)
+                await asyncio.to_thread(queue.heartbeat)
+        
+        async def slot():
+            while True:
+                key = await asyncio.to_thread(queue.claim)
+                if key is None:
+                    # Leases held by other workers come back to the queue if they die
+                    if await asyncio.to_thread(queue.leased_elsewhere):
+                        await asyncio.sleep(poll_interval)
+                        continue
+                    return
+                if key not in by_key:
+                    # Finished per this worker's manifest, e.g. by a worker that died before updating the queue
+                    await asyncio.to_thread(queue.finish, key, "done")
+                    continue
+                try:
+                    result = await run_task(by_key[key])
+                except BaseException:
+                    await asyncio.to_thread(queue.release, key)
+                    raise
+                results.append(result)
+                await asyncio.to_thread(queue.finish, key, "failed" if result["error"] else "done")
+        
+        beat = asyncio.ensure_future(heartbeat())
+        try:
+            await asyncio.gather(*(slot() for _ in range(slots)))
+        finally:
+            beat.cancel()
+        return results
+    
+    if engine_name == "async":
+        if queue:
+            return await run_queue(sum(concurrency.values())), engine["limiters"]
+        results = await asyncio.gather(*(run_task(task) for task in tasks))
+        return results, engine["limiters"]
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        engine["executor"] = executor
+        engine["pool_slots"] = asyncio.Semaphore(workers)
+        if queue:
+            return await run_queue(workers), engine["limiters"]
+        results = await asyncio.gather(*(run_task(task) for task in tasks))
+        return results, engine["limiters"]
+
+
+def build_batch_request(task: Dict[str, Any]) -> Dict[str, Any]:
+    """One line of a batch prediction input file for a task."""
+    parts = []
+    if task["prompt"]:
+        parts.append({"text": task["prompt"]})
+    parts.append({"fileData": {"fileUri": task.get("request_uri") or task["video_uri"], "mimeType": "video/mp4"}})
+    request = {"contents": [{"role": "user", "parts": parts}]}
+    if task.get("generation_config"):
+        request["generationConfig"] = task["generation_config"]
+    return {"request": request}
+
+
+def batch_request_video_uri(request: Dict[str, Any]) -> str:
+    """The video URI a batch request (as echoed back in its prediction) refers to."""
+    for content in request.get("contents", []):
+        for part in content.get("parts", []):
+            file_data = part.get("fileData") or part.get("file_data")
+            if file_data:
+                return file_data.get("fileUri") or file_data.get("file_uri")
+    return None
+
+
+def batch_response_text(response: Dict[str, Any], index: int = 0) -> str:
+    """Text of a candidate (the first by default) in a batch prediction response."""
+    candidates = response.get("candidates") or []
+    if len(candidates) <= index:
+        return None
+    parts = candidates[index].get("content", {}).get("parts", [])
+    return "".join(part.get("text", "") for part in parts)
+
+
+def batch_response_details(response: Dict[str, Any]) -> Dict[str, Any]:
+    """response_details() for a batch prediction response (REST JSON)."""
+    usage = response.get("usageMetadata") or {}
+    candidates = response.get("candidates") or [{}]
+    return {
+        "usage": {
+            "prompt_tokens": usage.get("promptTokenCount", 0),
+            "output_tokens": usage.get("candidatesTokenCount", 0),
+            "thinking_tokens": usage.get("thoughtsTokenCount", 0),
+            "total_tokens": usage.get("totalTokenCount", 0),
+        },
+        "finish_reason": candidates[0].get("finishReason"),
+    }
+
+
+def batch_model_resource(model_id: str) -> str:
+    """Model reference for a batch job: base model name or full resource path."""
+    if model_id.startswith("gemini-") or model_id.startswith("projects/"):
+        return model_id
+    return f"projects/{PROJECT_ID}/locations/{LOCATION}/endpoints/{model_id}"
+
+
+class VertexBatchBackend:
+    """Runs batch inputs as Vertex AI batch prediction jobs.
+    
+    Input files are staged under staging_uri (gs://bucket/prefix/) and each
+    job writes its predictions-*.jsonl files under its own output prefix.
+    """
+    
+    def __init__(self, staging_uri: str):
+        staging_uri = staging_uri.replace("gs://", "").rstrip("/")
+        self.bucket_name, _, self.prefix = staging_uri.partition("/")
+        self.storage_client = storage.Client(project=PROJECT_ID)
+    
+    def submit(self, job_name: str, model_id: str, input_path: Path):
+        from vertexai.batch_prediction import BatchPredictionJob
+        
+        bucket = self.storage_client.bucket(self.bucket_name)
+        input_blob = f"{self.prefix}/{job_name}/input.jsonl"
+        bucket.blob(input_blob).upload_from_filename(str(input_path))
+        return BatchPredictionJob.submit(
+            source_model=batch_model_resource(model_id),
+            input_dataset=f"gs://{self.bucket_name}/{input_blob}",
+            output_uri_prefix=f"gs://{self.bucket_name}/{self.prefix}/{job_name}/output",
+        )
+    
+    def job_ref(self, job) -> str:
+        """Reference to a submitted job that attach() can look up later."""
+        return job.resource_name
+    
+    def attach(self, job_ref: str):
+        """The job for a job_ref() from an earlier process, or None if it no longer exists."""
+        from vertexai.batch_prediction import BatchPredictionJob
+        
+        try:
+            return BatchPredictionJob(job_ref)
+        except NotFound:
+            return None
+    
+    def poll(self, job) -> Tuple[bool, str]:
+        """Returns (finished, error message or None)."""
+        job.refresh()
+        if not job.has_ended:
+            return False, None
+        return True, None if job.has_succeeded else str(job.error)
+    
+    def predictions(self, job):
+        output = job.output_location.replace("gs://", "")
+        bucket_name, _, prefix = output.partition("/")
+        bucket = self.storage_client.bucket(bucket_name)
+        for blob in bucket.list_blobs(prefix=prefix):
+            if blob.name.endswith(".jsonl"):
+                for line in blob.download_as_text().splitlines():
+                    if line.strip():
+                        yield json.loads(line)
+
+
+class LocalBatchBackend:
+    """Offline stand-in for VertexBatchBackend.
+    
+    "Runs" a batch by echoing every request back with a placeholder response
+    in the same predictions format Vertex uses, so the whole batch flow
+    (input building, polling, result mapping, output layout) can be exercised
+    without GCS or Vertex access.
+    """
+    
+    def __init__(self, work_dir: Path, delay: float = 0.0):
+        self.work_dir = work_dir
+        self.delay = delay
+    
+    def submit(self, job_name: str, model_id: str, input_path: Path):
+        output_path = self.work_dir / job_name / "predictions.jsonl"
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(input_path) as f_in, open(output_path, 'w') as f_out:
+            for line in f_in:
+                request = json.loads(line)["request"]
+                texts = [p.get("text", "") for c in request["contents"] for p in c["parts"]]
+                placeholder = (
+                    "1. (local batch stand-in response)"
+                    if NUMBERED_LIST_PROMPT in texts else '{"cutSegments": []}'
+                )
+                f_out.write(json.dumps({
+                    "status": "",
+                    "request": request,
+                    "response": {
+                        "candidates": [{"content": {"role": "model", "parts": [{"text": placeholder}]}, "finishReason": "STOP"}],
+                        "modelVersion": model_id,
+                    },
+                }) + "\n")
+        job = {"name": job_name, "output": str(output_path), "ready_at": time.time() + self.delay}
+        write_json(output_path.parent / "job.json", job)
+        return job
+    
+    def job_ref(self, job) -> str:
+        return job["name"]
+    
+    def attach(self, job_ref: str):
+        job_path = self.work_dir / job_ref / "job.json"
+        if not job_path.exists():
+            return None
+        with open(job_path) as f:
+            return json.load(f)
+    
+    def poll(self, job) -> Tuple[bool, str]:
+        return time.time() >= job["ready_at"], None
+    
+    def predictions(self, job):
+        with open(job["output"]) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def run_batch(tasks: List[Dict[str, Any]], run_dir: Path, backend, manifest: TaskManifest = None,
+              cache: ResponseCache = None, poll_interval: float = 30.0) -> List[Dict[str, Any]]:
+    """Run tasks as one batch prediction job per model and save their outputs.
+    
+    Cached responses are written straight away; the rest of each model's tasks
+    go into run_dir/batch/<model>/input.jsonl, are submitted together, and are
+    mapped back to their tasks by video URI once the job finishes. Outputs land
+    in the usual json/<video>_<model>.json layout.
+    
+    Submitted jobs are recorded in run_dir/batch/<model>/jobs.json. When a
+    resumed run's tasks belong to a recorded job that is still running (or
+    finished without its results being collected), that job is polled again
+    instead of submitting and paying for a second one. Only tasks without
+    such a job are submitted anew.
+    """
+    engine = {"run_dir": run_dir, "manifest": manifest}
+    results = []
+    jobs = []  # (model name, job, tasks, submitted wall time)
+    run_name = run_dir.name
+    
+    by_model: Dict[str, List[Dict[str, Any]]] = {}
+    for task in tasks:
+        by_model.setdefault(task["model_name"], []).append(task)
+    
+    for model_name, model_tasks in by_model.items():
+        pending = []
+        for task in model_tasks:
+            video_name = video_name_from_uri(task["video_uri"])
+            output_path = run_dir / "json" / f"{video_name}_{model_name}.json"
+            cached = cache.get(cache.key_for(task)) if cache else None
+            if cached is not None:
+                responses = [{"window": None, "text": cached["text"], "candidates": cached.get("candidates"), "error": None, "cached": True, "calls": []}]
+                log_call_metrics(run_dir, task, {"attempt": 0, "cached": True})
+                raw = raw_record(task, responses, inference={"cache": "hit", "attempts": 0})
+                result, parse_error = build_output(raw)
+                results.append(save_task_output(task, engine, output_path, result, raw=raw, cached=True, parse_error=parse_error))
+            else:
+                pending.append(task)
+        if not pending:
+            continue
+        
+        batch_dir = run_dir / "batch" / model_name
+        batch_dir.mkdir(parents=True, exist_ok=True)
+        jobs_path = batch_dir / "jobs.json"
+        records = []
+        if jobs_path.exists():
+            with open(jobs_path) as f:
+                records = json.load(f)
+        
+        # Reattach to earlier jobs that still hold some of these tasks
+        for record in records:
+            keys = set(record["tasks"])
+            covered = [task for task in pending if task.get("manifest_key") in keys]
+            if not covered:
+                continue
+            job = backend.attach(record["job"])
+            if job is None:
+                continue
+            finished, job_error = backend.poll(job)
+            if finished and job_error:
+                continue
+            print(f"[{model_name.upper()}] Reattaching to batch job {record['job']} "
+                  f"({len(covered)} requests, {'finished' if finished else 'still running'})")
+            jobs.append((model_name, job, covered, record["submitted"]))
+            pending = [task for task in pending if task.get("manifest_key") not in keys]
+        if not pending:
+            continue
+        
+        input_path = batch_dir / "input.jsonl"
+        with open(input_path, 'w') as f:
+            for task in pending:
+                f.write(json.dumps(build_batch_request(task)) + "\n")
+        
+        job_name = f"{run_name}_{model_name}" + (f"_{len(records)}" if records else "")
+        print(f"[{model_name.upper()}] Submitting batch of {len(pending)} requests ({input_path})...")
+        job = backend.submit(job_name, pending[0]["model_id"], input_path)
+        submitted = time.time()
+        records.append({
+            "job": backend.job_ref(job),
+            "submitted": submitted,
+            "tasks": [task["manifest_key"] for task in pending if task.get("manifest_key")],
+        })
+        write_json(jobs_path, records)
+        for task in pending:
+            if manifest and task.get("manifest_key"):
+                manifest.update(task["manifest_key"], "running", batch_job=backend.job_ref(job))
+        jobs.append((model_name, job, pending, submitted))
+    
+    while jobs:
+        for entry in list(jobs):
+            model_name, job, pending, submitted = entry
+            finished, job_error = backend.poll(job)
+            if not finished:
+                continue
+            jobs.remove(entry)
+            elapsed = time.time() - submitted
+            print(f"[{model_name.upper()}] Batch finished after {elapsed:.0f}s" + (f": {job_error}" if job_error else ""))
+            
+            by_uri = {task.get("request_uri") or task["video_uri"]: task for task in pending}
+            if not job_error:
+                for prediction in backend.predictions(job):
+                    task = by_uri.pop(batch_request_video_uri(prediction.get("request", {})), None)
+                    if task is None:
+                        continue
+                    video_name = video_name_from_uri(task["video_uri"])
+                    output_path = run_dir / "json" / f"{video_name}_{model_name}.json"
+                    response = prediction.get("response") or {}
+                    text = batch_response_text(response)
+                    count = len(response.get("candidates") or [])
+                    candidates = [batch_response_text(response, k) or "" for k in range(count)] if count > 1 else None
+                    call = {"attempt": 1, "latency_s": round(elapsed, 3), "text": text, "candidates": candidates, **batch_response_details(response)}
+                    inference = {"attempts": 1, "batch_job": backend.job_ref(job), "latency_s": round(elapsed, 3)}
+                    if prediction.get("status") or text is None:
+                        call["error"] = prediction.get("status") or "Empty batch response"
+                    log_call_metrics(run_dir, task, call)
+                    if call.get("error"):
+                        error = call["error"]
+                        responses = [{"window": None, "text": None, "candidates": None, "error": error, "cached": False, "calls": [call]}]
+                        raw = raw_record(task, responses, error, inference)
+                        result, _ = build_output(raw)
+                        results.append(save_task_output(task, engine, output_path, result, error=error, raw=raw, latency=elapsed, attempts=1))
+                        continue
+                    responses = [{"window": None, "text": text, "candidates": candidates, "error": None, "cached": False, "calls": [call]}]
+                    raw = raw_record(task, responses, inference=inference)
+                    result, problem = build_output(raw)
+                    if cache and not problem:
+                        cache.put(cache.key_for(task), text, task, candidates)
+                    summary = save_task_output(task, engine, output_path, result, raw=raw, latency=elapsed, attempts=1,
+                                               invalid_responses=int(bool(problem)), parse_error=problem)
+                    if summary["error"]:
+                        print(f"[{model_name.upper()}] ✗ {video_name}: {summary['error']} (batch)")
+                    else:
+                        print(f"[{model_name.upper()}] ✓ {video_name}: {summary['segments']} steps (batch)")
+                    results.append(summary)
+            
+            # Anything the job didn't return a prediction for has failed
+            for task in by_uri.values():
+                error = job_error or "No prediction returned by batch job"
+                video_name = video_name_from_uri(task["video_uri"])
+                output_path = run_dir / "json" / f"{video_name}_{model_name}.json"
+                print(f"[{model_name.upper()}] ✗ {video_name}: {error}")
+                results.append(save_task_output(task, engine, output_path, {"error": error}, error=error, latency=elapsed, attempts=1))
+        if jobs:
+            time.sleep(poll_interval)
+    
+    return results
+
+
+def probe_video_duration(video_uri: str, token: str) -> float:
+    """Read a video's duration with ffprobe straight from GCS (None on failure).
+    
+    ffprobe only fetches the container header via HTTP range requests, so this
+    doesn't download the video.
+    """
+    bucket_name, _, blob_name = video_uri.replace("gs://", "").partition("/")
+    url = f"https://storage.googleapis.com/{bucket_name}/{urllib.parse.quote(blob_name)}"
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-headers", f"Authorization: Bearer {token}\r\n",
+        "-show_entries", "format=duration",
+        "-of", "default=noprint_wrappers=1:nokey=1",
+        url,
+    ]
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=60, check=True)
+        return float(result.stdout.strip())
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError, ValueError):
+        return None
+
+
+def probe_video_durations(video_uris: List[str], workers: int = 16):
+    """Probe durations for all videos in parallel and record them in VIDEO_METADATA.
+    
+    Videos whose duration is already known (e.g. from the listing snapshot)
+    are skipped.
+    """
+    import google.auth
+    import google.auth.transport.requests
+    
+    known = sum(1 for uri in video_uris if VIDEO_METADATA.get(uri, {}).get("duration"))
+    video_uris = [uri for uri in video_uris if not VIDEO_METADATA.get(uri, {}).get("duration")]
+    if known:
+        print(f"Durations of {known} videos already known")
+    if not video_uris:
+        return
+    
+    credentials, _ = google.auth.default(scopes=["https://www.googleapis.com/auth/devstorage.read_only"])
+    credentials.refresh(google.auth.transport.requests.Request())
+    
+    print(f"Probing durations of {len(video_uris)} videos...")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(probe_video_duration, uri, credentials.token): uri for uri in video_uris}
+        probed = 0
+        for future in as_completed(futures):
+            duration = future.result()
+            if duration:
+                VIDEO_METADATA.setdefault(futures[future], {})["duration"] = duration
+                probed += 1
+    print(f"  ✓ Probed {probed}/{len(video_uris)} (others fall back to size-based estimates)")
+
+
+def predicted_latency(task: Dict[str, Any], latency_model: Dict[str, float]) -> float:
+    """Predicted call latency for a task from its video's (estimated) duration."""
+    if task.get("windows"):
+        # Windows run concurrently, so the longest one bounds the task
+        duration = max(end - start for start, end in task["windows"])
+    else:
+        duration = estimate_video_duration(task["video_uri"]) or 0.0
+    return latency_model["base_s"] + latency_model["per_video_second"] * duration
+
+
+def schedule_tasks(tasks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Order tasks longest video first, interleaving models.
+    
+    Starting the longest calls first (LPT scheduling) stops a few long videos
+    submitted last from stretching the run, and alternating between models
+    keeps both endpoints busy from the start instead of draining one model's
+    queue before the other's.
+    """
+    by_model: Dict[str, List[Dict[str, Any]]] = {}
+    for task in tasks:
+        by_model.setdefault(task["model_name"], []).append(task)
+    for model_tasks in by_model.values():
+        model_tasks.sort(key=lambda t: estimate_video_duration(t["video_uri"]) or 0.0, reverse=True)
+    
+    ordered = []
+    queues = list(by_model.values())
+    while any(queues):
+        for queue in queues:
+            if queue:
+                ordered.append(queue.pop(0))
+    return ordered
+
+
+def predict_makespan(tasks: List[Dict[str, Any]], slots: Dict[str, int], shared_slots: int,
+                     latency_model: Dict[str, float]) -> float:
+    """Simulate dispatching tasks in order and return the predicted wall time.
+    
+    Each task starts on the earliest free slot. With per-model slots (async
+    engine / adaptive limits) every model has its own pool; otherwise all
+    tasks share one pool of shared_slots threads.
+    """
+    pools: Dict[str, List[float]] = {}
+    for task in tasks:
+        pool_name = task["model_name"] if slots else "shared"
+        pool = pools.setdefault(pool_name, [0.0] * (slots.get(pool_name, 1) if slots else shared_slots))
+        start = min(pool)
+        pool[pool.index(start)] = start + predicted_latency(task, latency_model)
+    return max((max(pool) for pool in pools.values()), default=0.0)
+
+
+def fit_latency_model(results: List[Dict[str, Any]]) -> Dict[str, float]:
+    """Least-squares fit of latency = base_s + per_video_second * duration from finished calls."""
+    points = [
+        (estimate_video_duration(r["video_uri"]), r["latency"])
+        for r in results
+        if not r["cached"] and not r["error"] and estimate_video_duration(r["video_uri"])
+    ]
+    if len(points) < 2:
+        return None
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    var_x = sum((x - mean_x) ** 2 for x, _ in points)
+    if var_x == 0:
+        return None
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x
+    return {"base_s": round(mean_y - slope * mean_x, 2), "per_video_second": round(slope, 4)}
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of values (0.0 if empty)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def print_engine_report(results: List[Dict[str, Any]], engine_name: str, wall_time: float,
+                        limiters: Dict[str, AIMDController] = None, cache: ResponseCache = None):
+    """Print throughput and per-model latency for a finished run."""
+    print()
+    print("-" * 80)
+    print(f"Engine report ({engine_name}):")
+    print("-" * 80)
+    completed = [r for r in results if not r["error"]]
+    throughput = len(results) / wall_time if wall_time > 0 else 0.0
+    print(f"  Requests: {len(results)} ({len(completed)} ok, {len(results) - len(completed)} failed)")
+    print(f"  Wall time: {wall_time:.1f}s")
+    retried = [r for r in results if r["attempts"] > 1]
+    if retried:
+        print(
+            f"  Retried: {len(retried)} requests, {sum(r['attempts'] - 1 for r in retried)} extra attempts, "
+            f"{sum(r['retry_latency'] for r in retried):.1f}s spent before final attempts"
+        )
+    print(f"  Throughput: {throughput:.2f} requests/s ({throughput * 60:.1f} requests/min)")
+    if cache:
+        lookups = cache.hits + cache.misses
+        hit_rate = cache.hits / lookups if lookups else 0.0
+        print(
+            f"  Cache: {cache.hits} hits, {cache.misses} misses ({hit_rate:.0%} hit rate), "
+            f"{cache.bypassed} uncacheable, {cache.evictions} evicted, "
+            f"{cache.total_bytes / 1_000_000:.1f}/{cache.max_bytes / 1_000_000:.0f} MB"
+        )
+    for model_name in sorted(set(r["model_name"] for r in results if not r["cached"])):
+        latencies = [r["latency"] for r in results if r["model_name"] == model_name and not r["cached"]]
+        print(
+            f"  {model_name} latency: mean {sum(latencies) / len(latencies):.1f}s, "
+            f"p50 {percentile(latencies, 50):.1f}s, p95 {percentile(latencies, 95):.1f}s, "
+            f"max {max(latencies):.1f}s"
+        )
+    for model_name, prompt_type in sorted(set((r["model_name"], r["prompt_type"]) for r in results)):
+        group = [
+            r for r in results
+            if (r["model_name"], r["prompt_type"]) == (model_name, prompt_type) and (not r["error"] or r["parse_error"])
+        ]
+        if prompt_type == "numbered" or not group:
+            continue
+        # Cache hits were valid when stored, so only fresh responses count
+        fresh = [r for r in group if not r["cached"]]
+        responses = sum(r["attempts"] for r in fresh)
+        invalid = sum(r["invalid_responses"] for r in fresh)
+        unparsed = sum(1 for r in group if r["parse_error"])
+        rate = invalid / responses if responses else 0.0
+        print(
+            f"  {model_name}/{prompt_type} parse failures: {invalid}/{responses} responses ({rate:.1%}), "
+            f"{unparsed}/{len(group)} outputs unparsed (saved, marked failed)"
+        )
+    for model_name, limiter in sorted((limiters or {}).items()):
+        if limiter.adaptive:
+            print(
+                f"  {model_name} concurrency: final {int(limiter.limit)}, peak {int(limiter.peak_limit)}, "
+                f"max {limiter.maximum}, throttled {limiter.throttles}x"
+            )
+
+
+def print_metrics_report(run_dir: Path):
+    """Print per-call latency percentiles and token totals per model, prompt type and profile.
+    
+    Reads the run's metrics.jsonl, so a resumed run reports on all its calls.
+    """
+    metrics_path = run_dir / METRICS_FILE
+    if not metrics_path.exists():
+        return
+    with open(metrics_path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    calls = [r for r in records if not r["cached"]]
+    if not calls:
+        return
+    
+    print()
+    print("-" * 80)
+    print(f"Per-call metrics ({len(calls)} calls, {len(records) - len(calls)} cache hits; {metrics_path}):")
+    print("-" * 80)
+    print(f"  {'model/prompt':<28} {'':<10} {'p50':>8} {'p90':>8} {'p99':>8}")
+    groups = sorted(set((r["model_name"], r["prompt_type"], r.get("profile", "default")) for r in calls))
+    for model_name, prompt_type, profile in groups:
+        group = [r for r in calls if (r["model_name"], r["prompt_type"], r.get("profile", "default")) == (model_name, prompt_type, profile)]
+        ok = [r for r in group if not r["error"]]
+        label = f"{model_name}/{prompt_type}" + (f" [{profile}]" if profile != "default" else "")
+        series = [
+            ("queue wait", [r["queue_wait_s"] for r in group]),
+            ("ttfb", [r["ttfb_s"] for r in ok if r["ttfb_s"] is not None]),
+            ("latency", [r["latency_s"] for r in ok]),
+        ]
+        for name, values in series:
+            if not values:
+                continue
+            print(
+                f"  {label:<28} {name:<10} {percentile(values, 50):>7.1f}s "
+                f"{percentile(values, 90):>7.1f}s {percentile(values, 99):>7.1f}s"
+            )
+            label = ""
+        print(
+            f"  {'':<28} tokens: {sum(r['prompt_tokens'] for r in ok):,} in, "
+            f"{sum(r['output_tokens'] for r in ok):,} out, {sum(r['thinking_tokens'] for r in ok):,} thinking; "
+            f"{len(ok)} ok, {len(group) - len(ok)} failed, {sum(1 for r in group if r['retries'])} retries"
+        )
+
+
+def add_model_arguments(parser: argparse.ArgumentParser):
+    """Add the video source / model / prompt / output arguments shared by the inference tools."""
+    parser.add_argument(
+        "--gcs-path",
+        type=str,
+        default=f"{os.getenv('GCS_BUCKET', 'buildai-dataset')}/{os.getenv('GCS_PREFIX', 'finetune_dataset/')}",
+        help="GCS path to videos (e.g., gs://bucket/prefix or bucket/prefix). Default from .env"
+    )
+    parser.add_argument(
+        "--model1",
+        type=str,
+        default=os.getenv("FINETUNED_MODEL_ENDPOINT"),
+        help="First model endpoint ID. Default from .env"
+    )
+    parser.add_argument(
+        "--model2",
+        type=str,
+        default="gemini-2.5-pro",
+        help="Second model endpoint ID or name. Default: gemini-2.5-pro"
+    )
+    parser.add_argument(
+        "--model1-name",
+        type=str,
+        default="model1",
+        help="Name for first model in output files. Default: model1"
+    )
+    parser.add_argument(
+        "--model2-name",
+        type=str,
+        default="model2",
+        help="Name for second model in output files. Default: model2"
+    )
+    parser.add_argument(
+        "--model1-no-prompt",
+        action="store_true",
+        help="Don't send prompt to model1, just send the video"
+    )
+    parser.add_argument(
+        "--model2-no-prompt",
+        action="store_true",
+        help="Don't send prompt to model2, just send the video"
+    )
+    parser.add_argument(
+        "--model1-prompt",
+        type=str,
+        choices=["default", "granular", "numbered"],
+        default="default",
+        help="Which prompt to use for model1: 'default' (MM:SS), 'granular' (MM:SS.ss), or 'numbered' (numbered list)"
+    )
+    parser.add_argument(
+        "--model2-prompt",
+        type=str,
+        choices=["default", "granular", "numbered"],
+        default="default",
+        help="Which prompt to use for model2: 'default' (MM:SS), 'granular' (MM:SS.ss), or 'numbered' (numbered list)"
+    )
+    parser.add_argument(
+        "--model1-profile",
+        type=str,
+        choices=sorted(GENERATION_PROFILES),
+        default="default",
+        help="Generation profile for model1 (thinking budget, max output tokens, temperature). Default: model defaults"
+    )
+    parser.add_argument(
+        "--model2-profile",
+        type=str,
+        choices=sorted(GENERATION_PROFILES),
+        default="default",
+        help="Generation profile for model2 (thinking budget, max output tokens, temperature). Default: model defaults"
+    )
+    parser.add_argument(
+        "--proxy",
+        type=str,
+        metavar="PROFILE",
+        help="Infer on cached low-res/low-fps proxies (see make_proxies.py) instead of the source videos; "
+             "missing proxies are built first. Outputs keep the source video names"
+    )
+    parser.add_argument(
+        "--media-resolution",
+        type=str,
+        choices=sorted(MEDIA_RESOLUTIONS),
+        help="Media resolution generation setting (fewer tokens per frame at 'low'). Default: model default"
+    )
+    parser.add_argument(
+        "--structured",
+        action="store_true",
+        help="Constrain timestamped prompts to a cutSegments JSON response schema (numbered prompts are unaffected)"
+    )
+    parser.add_argument(
+        "--candidates",
+        type=int,
+        default=1,
+        help="Sample N candidates per (video, model) in one request (candidate_count) and store them all "
+             "with a step-count spread summary. Default: 1"
+    )
+    parser.add_argument(
+        "--chunk-seconds",
+        type=float,
+        default=0,
+        help="Split videos longer than this into overlapping windows, inferred concurrently and merged "
+             "(timestamped prompts only; implies --probe-durations). Default: 0 (off)"
+    )
+    parser.add_argument(
+        "--chunk-overlap",
+        type=float,
+        default=10,
+        help="Seconds of overlap between adjacent windows in chunked mode. Default: 10"
+    )
+
+
+def prompt_sha256(prompt: str) -> str:
+    """Hash of the exact prompt text sent to a model ('' for no prompt)."""
+    return hashlib.sha256((prompt or "").encode()).hexdigest()
+
+
+def build_run_config(args: argparse.Namespace) -> Dict[str, Any]:
+    """Run config for run_config.json: the model/prompt settings plus prompt hashes."""
+    run_config = {key: getattr(args, key) for key in RUN_CONFIG_KEYS}
+    for slot in ("model1", "model2"):
+        prompt_type = "none" if run_config[f"{slot}_no_prompt"] else run_config[f"{slot}_prompt"]
+        run_config[f"{slot}_prompt_sha256"] = prompt_sha256(get_prompt(prompt_type))
+    run_config["created"] = datetime.now().isoformat()
+    return run_config
+
+
+def add_video_tasks(args: argparse.Namespace, manifest: TaskManifest, video_uris: List[str]) -> int:
+    """Add both models' tasks for each video to the manifest; returns how many need inference.
+    
+    A video already in the manifest is only inferred again if its blob
+    generation changed (the file was replaced).
+    """
+    added = 0
+    for video_uri in video_uris:
+        metadata = VIDEO_METADATA.get(video_uri) or {}
+        for slot in ("model1", "model2"):
+            model_name = getattr(args, f"{slot}_name")
+            prompt_type = "none" if getattr(args, f"{slot}_no_prompt") else getattr(args, f"{slot}_prompt")
+            key = manifest.task_key(video_uri, model_name, prompt_type)
+            task = manifest.tasks.get(key)
+            if task is None:
+                manifest.add_task(video_uri, model_name, getattr(args, slot), prompt_type, metadata)
+                added += 1
+            elif str(task.get("video", {}).get("generation")) != str(metadata.get("generation")):
+                manifest.update(key, "pending", video=metadata, error=None)
+                added += 1
+    return added
+
+
+def push_outputs(run_dir: Path, results: List[Dict[str, Any]]):
+    """Upload a round's successful outputs to the scoring app's inference_runs/ layout."""
+    from upload_inference_to_gcs import upload_outputs
+    
+    outputs = sorted(r["output"] for r in results if not r["error"])
+    if outputs:
+        upload_outputs(run_dir, [run_dir / "json" / name for name in outputs])
+
+
+def record_shard_listing(run_dir: Path, video_uris: List[str]):
+    """Update a shard run's config with the current full listing, so merge_shards.py checks the latest one."""
+    config_path = run_dir / RUN_CONFIG_FILE
+    with open(config_path) as f:
+        run_config = json.load(f)
+    digest = listing_digest(video_uris)
+    if run_config["shard"]["listing_sha256"] != digest:
+        run_config["shard"].update(listed_videos=len(video_uris), listing_sha256=digest)
+        write_json(config_path, run_config)
+
+
+def watch_for_videos(args: argparse.Namespace, run_dir: Path, manifest: TaskManifest):
+    """Poll the GCS prefix and infer newly arrived or replaced videos into the same run.
+    
+    A shard run only picks up the videos in its own shard.
+    """
+    print()
+    print("=" * 80)
+    print(f"Watching {args.gcs_path} every {args.watch_interval:.0f}s (Ctrl+C to stop)")
+    print(f"  Rolling run directory: {run_dir}")
+    if args.shard:
+        print(f"  Shard: {args.shard[0]}/{args.shard[1]}")
+    print("=" * 80)
+    try:
+        while True:
+            time.sleep(args.watch_interval)
+            video_uris = list_videos_from_gcs(args.gcs_path, quiet=True)
+            listed = len(video_uris)
+            if args.shard:
+                index, count = args.shard
+                record_shard_listing(run_dir, video_uris)
+                video_uris = [uri for uri in video_uris if shard_of(uri, count) == index]
+            added = add_video_tasks(args, manifest, video_uris)
+            if not added:
+                print(f"[WATCH] {datetime.now():%H:%M:%S} no new videos ({len(video_uris)} of {listed} listed)")
+                continue
+            print(f"[WATCH] {datetime.now():%H:%M:%S} {added} new tasks")
+            infer_pending(args, run_dir, manifest)
+    except KeyboardInterrupt:
+        print()
+        print(f"Stopped watching. Resume with: python run_inference.py --resume {run_dir} --watch")
+
+
+def infer_pending(args: argparse.Namespace, run_dir: Path, manifest: TaskManifest) -> List[Dict[str, Any]]:
+    """Run every unfinished task in the manifest and print the run report."""
+    pending_keys = manifest.unfinished()
+    if not pending_keys:
+        print("Nothing to do: every task in the manifest is done.")
+        return []
+    
+    if args.batch:
+        # Batch jobs reference models by name; nothing to load locally
+        models = {args.model1_name: None, args.model2_name: None}
+    else:
+        print()
+        print("-" * 80)
+        print("Initializing models...")
+        print("-" * 80)
+        
+        model1 = load_model(args.model1, args.model1_name)
+        model2 = load_model(args.model2, args.model2_name)
+        models = {args.model1_name: model1, args.model2_name: model2}
+    
+    tasks = []
+    profiles = {args.model1_name: args.model1_profile, args.model2_name: args.model2_profile}
+    for key in pending_keys:
+        entry = manifest.tasks[key]
+        profile = profiles[entry["model_name"]]
+        tasks.append({
+            "video_uri": entry["video_uri"],
+            "model": models[entry["model_name"]],
+            "model_name": entry["model_name"],
+            "model_id": entry["model_id"],
+            "prompt": get_prompt(entry["prompt_type"]),
+            "prompt_type": entry["prompt_type"],
+            "profile": profile,
+            "generation_config": dict(GENERATION_PROFILES[profile]),
+            "manifest_key": key,
+        })
+    
+    engine_name = "batch" if args.batch else args.engine
+    
+    if args.media_resolution:
+        for task in tasks:
+            task["generation_config"] = dict(
+                task.get("generation_config") or {},
+                media_resolution=MEDIA_RESOLUTIONS[args.media_resolution],
+            )
+    
+    if args.candidates > 1:
+        if args.stream:
+            print("ERROR: --candidates can't be combined with --stream")
+            sys.exit(1)
+        for task in tasks:
+            task["generation_config"] = dict(task.get("generation_config") or {}, candidate_count=args.candidates)
+    
+    if args.structured:
+        for task in tasks:
+            if task["prompt_type"] != "numbered":
+                task["generation_config"] = dict(
+                    task.get("generation_config") or {},
+                    response_mime_type="application/json",
+                    response_schema=CUT_SEGMENTS_SCHEMA,
+                )
+    
+    # Fail fast if the installed SDK doesn't know a generation setting
+    for task in tasks:
+        if task.get("generation_config"):
+            try:
+                make_generation_config(task["generation_config"])
+            except (ValueError, TypeError, KeyError) as e:
+                print(f"ERROR: Generation settings for {task['model_name']} not supported by the installed SDK: {e}")
+                print(f"  Settings: {task['generation_config']}")
+                sys.exit(1)
+    
+    if args.proxy:
+        from make_proxies import PROXY_PROFILES, ensure_proxies
+        
+        if args.proxy not in PROXY_PROFILES:
+            print(f"ERROR: Unknown proxy profile '{args.proxy}' (choose from: {', '.join(PROXY_PROFILES)})")
+            sys.exit(1)
+        video_uris = sorted(set(task["video_uri"] for task in tasks))
+        proxies = ensure_proxies(
+            {uri: VIDEO_METADATA.get(uri, {}).get("generation") for uri in video_uris},
+            args.proxy,
+        )
+        for task in tasks:
+            task["request_uri"] = proxies.get(task["video_uri"])
+    
+    if args.chunk_seconds and args.batch:
+        print("ERROR: --chunk-seconds is not supported with --batch")
+        sys.exit(1)
+    
+    if args.chunk_seconds and not 0 <= args.chunk_overlap < args.chunk_seconds:
+        print(f"ERROR: --chunk-overlap must be at least 0 and less than --chunk-seconds "
+              f"(got {args.chunk_overlap:g} and {args.chunk_seconds:g})")
+        sys.exit(1)
+    
+    if args.probe_durations or args.chunk_seconds:
+        probe_video_durations(sorted(set(task["video_uri"] for task in tasks)))
+        if not args.resume:
+            save_listing_snapshot(args.gcs_path, sorted(VIDEO_METADATA))
+    
+    if args.chunk_seconds:
+        chunked = 0
+        for task in tasks:
+            duration = estimate_video_duration(task["video_uri"])
+            if task["prompt_type"] in ("default", "granular") and duration and duration > args.chunk_seconds:
+                task["windows"] = plan_windows(duration, args.chunk_seconds, args.chunk_overlap)
+                chunked += 1
+        print(f"Chunked {chunked} tasks into {args.chunk_seconds:.0f}s windows ({args.chunk_overlap:.0f}s overlap)")
+    
+    # Predict makespan for name order vs the chosen schedule
+    base_s, per_video_second = (float(x) for x in args.latency_model.split(","))
+    latency_model = {"base_s": base_s, "per_video_second": per_video_second}
+    if args.engine == "async" or args.adaptive:
+        slots = {args.model1_name: args.model1_concurrency, args.model2_name: args.model2_concurrency}
+    else:
+        slots = {}
+    tasks.sort(key=lambda t: (video_name_from_uri(t["video_uri"]), t["model_name"]))
+    name_order_makespan = predict_makespan(tasks, slots, args.workers, latency_model)
+    if args.schedule == "longest-first":
+        tasks = schedule_tasks(tasks)
+    predicted_makespan = predict_makespan(tasks, slots, args.workers, latency_model)
+    
+    queue = None
+    if args.queue:
+        if args.batch:
+            print("ERROR: --queue is not supported with --batch")
+            sys.exit(1)
+        queue = WorkQueue(run_dir / QUEUE_FILE, lease_seconds=args.lease_seconds)
+        queue.add([task["manifest_key"] for task in tasks])
+        if args.resume:
+            queue.requeue_failed()
+        print()
+        print(f"Work queue: {run_dir / QUEUE_FILE} {queue.counts()} (worker {queue.worker})")
+        print(f"  Add workers with: python run_inference.py --resume {run_dir} --queue")
+    print()
+    print("-" * 80)
+    print(f"Running {len(tasks)} of {len(manifest.tasks)} tasks IN PARALLEL ({engine_name} engine)...")
+    print("-" * 80)
+    
+    # Run all tasks in parallel
+    retry_policy = dict(
+        DEFAULT_RETRY_POLICY,
+        max_attempts=args.max_attempts,
+        deadline_base=args.deadline_base,
+        deadline_per_second=args.deadline_per_second,
+        invalid_retries=args.invalid_retries,
+    )
+    concurrency = {
+        args.model1_name: args.model1_concurrency,
+        args.model2_name: args.model2_concurrency,
+    }
+    cache = None if args.no_cache else ResponseCache(Path(args.cache_dir), args.cache_max_mb * 1_000_000)
+    run_start = time.perf_counter()
+    if args.batch:
+        if args.batch_local:
+            backend = LocalBatchBackend(run_dir / "batch" / "local")
+        else:
+            backend = VertexBatchBackend(args.batch_staging)
+        results = run_batch(tasks, run_dir, backend, manifest=manifest, cache=cache,
+                            poll_interval=args.batch_poll_interval)
+        limiters = {}
+    else:
+        results, limiters = asyncio.run(run_tasks(
+            tasks, run_dir, args.engine, args.workers, concurrency,
+            adaptive=args.adaptive, adaptive_start=args.adaptive_start,
+            retry_policy=retry_policy, manifest=manifest, cache=cache, stream=args.stream,
+            queue=queue,
+        ))
+    wall_time = time.perf_counter() - run_start
+    
+    # Print summary
+    print()
+    print("-" * 80)
+    print("Summary by video:")
+    print("-" * 80)
+    
+    video_names = sorted(set(r["video_name"] for r in results))
+    for video_name in video_names:
+        model1_result = next((r for r in results if r["video_name"] == video_name and r["model_name"] == args.model1_name), None)
+        model2_result = next((r for r in results if r["video_name"] == video_name and r["model_name"] == args.model2_name), None)
+        
+        model1_status = f"{model1_result['segments']} segments" if model1_result and not model1_result["error"] else f"ERROR: {model1_result['error']}" if model1_result else "N/A"
+        model2_status = f"{model2_result['segments']} segments" if model2_result and not model2_result["error"] else f"ERROR: {model2_result['error']}" if model2_result else "N/A"
+        
+        print(f"  {video_name}:")
+        print(f"    {args.model1_name}: {model1_status}")
+        print(f"    {args.model2_name}: {model2_status}")
+    
+    print_engine_report(results, engine_name, wall_time, limiters, cache)
+    print_metrics_report(run_dir)
+    if queue:
+        print(f"  Work queue: {queue.counts()}, {queue.reclaimed} expired leases re-claimed by this worker")
+    if not args.batch:
+        print(f"  Schedule: {args.schedule}")
+        print(
+            f"  Makespan: predicted {predicted_makespan:.0f}s "
+            f"(name order: {name_order_makespan:.0f}s), actual {wall_time:.0f}s"
+        )
+        fitted = fit_latency_model(results)
+        if fitted:
+            print(f"  Fitted latency model: --latency-model {fitted['base_s']},{fitted['per_video_second']}")
+    
+    counts = queue.counts() if queue else manifest.counts()
+    print()
+    print("=" * 80)
+    print("✓ Inference complete!")
+    print(f"  Output directory: {run_dir}")
+    print(f"  JSON outputs saved to: {run_dir / 'json'}")
+    print(f"  {'Work queue' if queue else 'Manifest'}: {counts}")
+    if counts.get("failed"):
+        print(f"  Re-run failed tasks with: python run_inference.py --resume {run_dir}{' --queue' if queue else ''}")
+    print()
+    print("Next steps:")
+    print(f"  1. Run: python create_subtitles.py {run_dir}")
+    print(f"  2. Run: python burn_subtitles.py {run_dir}")
+    print("=" * 80)
+    
+    if args.push:
+        push_outputs(run_dir, results)
+    return results
+
+
+def main():
+    """Main execution function."""
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description="Run inference on videos using Gemini models")
+    add_model_arguments(parser)
+    parser.add_argument(
+        "--engine",
+        type=str,
+        choices=["threads", "async"],
+        default="threads",
+        help="Execution engine: 'threads' (one blocking thread per request) or 'async' (generate_content_async). Default: threads"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=20,
+        help="Thread pool size for the threads engine. Default: 20"
+    )
+    parser.add_argument(
+        "--model1-concurrency",
+        type=int,
+        default=20,
+        help="Max in-flight requests to model1 for the async engine. Default: 20"
+    )
+    parser.add_argument(
+        "--model2-concurrency",
+        type=int,
+        default=20,
+        help="Max in-flight requests to model2 for the async engine. Default: 20"
+    )
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="Tune each model's in-flight requests with AIMD: grow while calls succeed, halve on 429/ResourceExhausted. "
+             "--model1-concurrency / --model2-concurrency become the ceilings"
+    )
+    parser.add_argument(
+        "--adaptive-start",
+        type=int,
+        default=4,
+        help="Initial in-flight requests per model in --adaptive mode. Default: 4"
+    )
+    parser.add_argument(
+        "--max-attempts",
+        type=int,
+        default=DEFAULT_RETRY_POLICY["max_attempts"],
+        help=f"Max calls per task, retrying quota/transient errors and timeouts. Default: {DEFAULT_RETRY_POLICY['max_attempts']}"
+    )
+    parser.add_argument(
+        "--deadline-base",
+        type=float,
+        default=DEFAULT_RETRY_POLICY["deadline_base"],
+        help=f"Per-call deadline in seconds before scaling by video duration. Default: {DEFAULT_RETRY_POLICY['deadline_base']:.0f}"
+    )
+    parser.add_argument(
+        "--deadline-per-second",
+        type=float,
+        default=DEFAULT_RETRY_POLICY["deadline_per_second"],
+        help=f"Extra deadline seconds per second of video. Default: {DEFAULT_RETRY_POLICY['deadline_per_second']}"
+    )
+    parser.add_argument(
+        "--schedule",
+        type=str,
+        choices=["longest-first", "name"],
+        default="longest-first",
+        help="Task order: longest videos first with models interleaved, or by video name. Default: longest-first"
+    )
+    parser.add_argument(
+        "--probe-durations",
+        action="store_true",
+        help="Probe real video durations with ffprobe for scheduling and deadlines (default: estimate from blob size)"
+    )
+    parser.add_argument(
+        "--latency-model",
+        type=str,
+        default=f"{DEFAULT_LATENCY_MODEL['base_s']},{DEFAULT_LATENCY_MODEL['per_video_second']}",
+        metavar="BASE_S,PER_VIDEO_SECOND",
+        help="Per-call latency model used to predict makespan (the run reports a fitted one). "
+             f"Default: {DEFAULT_LATENCY_MODEL['base_s']},{DEFAULT_LATENCY_MODEL['per_video_second']}"
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream responses so each call's time to first byte is recorded in metrics.jsonl"
+    )
+    parser.add_argument(
+        "--invalid-retries",
+        type=int,
+        default=DEFAULT_RETRY_POLICY["invalid_retries"],
+        help=f"Extra calls when a timestamped response fails to parse or validate. Default: {DEFAULT_RETRY_POLICY['invalid_retries']}"
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Submit all tasks as one Vertex batch prediction job per model instead of online calls"
+    )
+    parser.add_argument(
+        "--batch-staging",
+        type=str,
+        default=f"gs://{os.getenv('GCS_BUCKET', 'buildai-dataset')}/batch_prediction",
+        help="GCS prefix for batch input/output files. Default: gs://<GCS_BUCKET>/batch_prediction"
+    )
+    parser.add_argument(
+        "--batch-local",
+        action="store_true",
+        help="Use the offline batch stand-in (placeholder responses, no Vertex/GCS calls) to test the batch flow"
+    )
+    parser.add_argument(
+        "--batch-poll-interval",
+        type=float,
+        default=30.0,
+        help="Seconds between batch job status checks. Default: 30"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always call Vertex, ignoring the local response cache"
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=str(CACHE_DIR),
+        help=f"Local response cache directory. Default: {CACHE_DIR}"
+    )
+    parser.add_argument(
+        "--cache-max-mb",
+        type=int,
+        default=CACHE_MAX_MB,
+        help=f"Evict least recently used cache entries beyond this size. Default: {CACHE_MAX_MB}"
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="After the run, keep polling --gcs-path and infer newly arrived (or replaced) videos into the same run directory"
+    )
+    parser.add_argument(
+        "--watch-interval",
+        type=float,
+        default=60.0,
+        help="Seconds between polls in --watch mode. Default: 60"
+    )
+    parser.add_argument(
+        "--push",
+        action="store_true",
+        help="Upload new outputs to the scoring app's inference_runs/ layout after the run (and after each --watch round)"
+    )
+    parser.add_argument(
+        "--queue",
+        action="store_true",
+        help="Pull tasks from a work queue in the run directory, so several worker processes can share the run. "
+             "Start more workers with --resume RUN_DIR --queue"
+    )
+    parser.add_argument(
+        "--lease-seconds",
+        type=float,
+        default=120.0,
+        help="With --queue: how long a task stays claimed without a heartbeat before other workers re-claim it. Default: 120"
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        metavar="I/N",
+        help="Only infer shard I of N (0-based) of the videos, split by a stable hash of the video URI. "
+             "Run one shard per machine and combine the runs with merge_shards.py"
+    )
+    parser.add_argument(
+        "--resume",
+        type=str,
+        metavar="RUN_DIR",
+        help="Resume an interrupted run: re-dispatch only its pending/failed tasks, using the run's saved model and prompt settings"
+    )
+    args = parser.parse_args()
+    
+    if args.resume:
+        run_dir = Path(args.resume)
+        config_path = run_dir / RUN_CONFIG_FILE
+        if not config_path.exists() or not (run_dir / MANIFEST_FILE).exists():
+            print(f"ERROR: {run_dir} has no {RUN_CONFIG_FILE} / {MANIFEST_FILE} to resume from")
+            sys.exit(1)
+        with open(config_path) as f:
+            run_config = json.load(f)
+        # The models, prompts and output settings a run was started with define
+        # its tasks (older runs without some of them used the defaults)
+        for key in RUN_CONFIG_KEYS:
+            setattr(args, key, run_config.get(key, parser.get_default(key)))
+        # A shard run stays on its shard (and --watch only adds that shard's videos)
+        shard = run_config.get("shard")
+        if shard:
+            if args.shard and args.shard != (shard["index"], shard["count"]):
+                print(f"ERROR: {run_dir} is shard {shard['index']}/{shard['count']}, not {args.shard[0]}/{args.shard[1]}")
+                sys.exit(1)
+            args.shard = (shard["index"], shard["count"])
+        elif args.shard:
+            print(f"ERROR: {run_dir} was not started with --shard")
+            sys.exit(1)
+    else:
+        run_dir = create_run_dir()
+    
+    print("=" * 80)
+    print("Gemini Model Comparison - Video Inference")
+    print("=" * 80)
+    print(f"Project: {PROJECT_ID}")
+    print(f"Location: {LOCATION}")
+    print(f"GCS Path: {args.gcs_path}")
+    if args.resume:
+        print(f"Resuming: {run_dir}")
+    if args.shard:
+        print(f"Shard: {args.shard[0]}/{args.shard[1]}")
+    print()
+    print(f"Model 1 ({args.model1_name}): {args.model1}")
+    if args.model1_no_prompt:
+        print(f"  Prompt: NO")
+    else:
+        print(f"  Prompt: {args.model1_prompt.upper()}")
+    print(f"  Profile: {args.model1_profile} {GENERATION_PROFILES[args.model1_profile]}")
+    print(f"Model 2 ({args.model2_name}): {args.model2}")
+    if args.model2_no_prompt:
+        print(f"  Prompt: NO")
+    else:
+        print(f"  Prompt: {args.model2_prompt.upper()}")
+    print(f"  Profile: {args.model2_profile} {GENERATION_PROFILES[args.model2_profile]}")
+    print()
+    
+    manifest = TaskManifest(run_dir)
+    if args.resume:
+        # Tasks (and the video metadata used for deadlines) come from the manifest
+        for task in manifest.tasks.values():
+            VIDEO_METADATA.setdefault(task["video_uri"], task.get("video", {}))
+        print(f"Manifest: {manifest.counts()}")
+    else:
+        # List videos
+        video_uris = list_videos_from_gcs(args.gcs_path)
+        if not video_uris:
+            print("ERROR: No videos found!")
+            sys.exit(1)
+        
+        run_config = build_run_config(args)
+        if args.shard:
+            index, count = args.shard
+            run_config["shard"] = {
+                "index": index,
+                "count": count,
+                "listed_videos": len(video_uris),
+                "listing_sha256": listing_digest(video_uris),
+            }
+            video_uris = [uri for uri in video_uris if shard_of(uri, count) == index]
+            print(f"Shard {index}/{count}: {len(video_uris)} of {run_config['shard']['listed_videos']} videos")
+        write_json(run_dir / RUN_CONFIG_FILE, run_config)
+        
+        # Create all tasks (video x model combinations)
+        add_video_tasks(args, manifest, video_uris)
+    
+    infer_pending(args, run_dir, manifest)
+    if args.watch:
+        watch_for_videos(args, run_dir, manifest)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Run a prompt x model sweep over a set of videos in one run.
+
+Every (video, model, prompt) cell is one task on the run_inference.py engine,
+so the whole grid is scheduled together with the usual retries, caching,
+manifest and metrics. Prompts asked of the same gemini-* model about the same
+video share one Vertex cached content holding the video, instead of sending
+the video with every prompt. Outputs are json/<video>_<model>_<prompt>.json;
+each records its own timing under "inference", and sweep_summary.json in the
+run directory holds the timing of every cell.
+"""
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+from pathlib import Path
+from typing import List, Dict, Any
+from datetime import datetime
+
+from run_inference import (
+    CACHE_DIR,
+    CACHE_MAX_MB,
+    DEFAULT_RETRY_POLICY,
+    GENERATION_PROFILES,
+    MANIFEST_FILE,
+    RUN_CONFIG_FILE,
+    VIDEO_METADATA,
+    ResponseCache,
+    TaskManifest,
+    VideoContextCache,
+    create_run_dir,
+    get_prompt,
+    list_videos_from_gcs,
+    load_model,
+    percentile,
+    print_engine_report,
+    print_metrics_report,
+    prompt_sha256,
+    run_tasks,
+    schedule_tasks,
+    video_name_from_uri,
+    write_json,
+)
+
+PROMPT_TYPES = ["default", "granular", "numbered", "none"]
+
+
+def parse_models(values: List[str]) -> Dict[str, str]:
+    """Parse --model NAME=MODEL_ID arguments (a bare MODEL_ID is its own name)."""
+    models = {}
+    for value in values:
+        name, sep, model_id = value.partition("=")
+        if not sep:
+            name, model_id = value, value
+        if not name or not model_id or "_" in name:
+            print(f"ERROR: --model expects NAME=MODEL_ID with no '_' in NAME, got '{value}'")
+            sys.exit(1)
+        models[name] = model_id
+    return models
+
+
+def print_sweep_grid(results: List[Dict[str, Any]], models: List[str], prompts: List[str]):
+    """Print steps and latency for every model x prompt cell, over all videos."""
+    print()
+    print("-" * 80)
+    print("Sweep grid (mean steps, p50 / max latency of uncached calls):")
+    print("-" * 80)
+    print(f"  {'model':<20} " + " ".join(f"{prompt:>17}" for prompt in prompts))
+    for model_name in models:
+        cells = []
+        for prompt_type in prompts:
+            cell = [r for r in results if r["model_name"] == model_name and r["prompt_type"] == prompt_type and not r["error"]]
+            latencies = [r["latency"] for r in cell if not r["cached"]]
+            if not cell:
+                cells.append(f"{'-':>17}")
+                continue
+            steps = sum(r["segments"] for r in cell) / len(cell)
+            timing = f"{percentile(latencies, 50):.0f}/{max(latencies):.0f}s" if latencies else "cached"
+            cells.append(f"{steps:>6.1f} {timing:>10}")
+        print(f"  {model_name:<20} " + " ".join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run every prompt on every model for a set of videos, sharing cached video context"
+    )
+    parser.add_argument(
+        "--gcs-path",
+        type=str,
+        default="gs://buildai-dataset/finetune_dataset/test/",
+        help="GCS path to videos (default: gs://buildai-dataset/finetune_dataset/test/)"
+    )
+    parser.add_argument(
+        "--model",
+        type=str,
+        action="append",
+        default=[],
+        metavar="NAME=MODEL_ID",
+        help="Model to sweep (repeatable), e.g. --model baseline=gemini-2.5-pro --model finetuned=<endpoint>"
+    )
+    parser.add_argument(
+        "--prompts",
+        type=str,
+        nargs="+",
+        choices=PROMPT_TYPES,
+        default=["default", "granular", "numbered"],
+        help="Prompt variants to sweep ('none' sends only the video). Default: default granular numbered"
+    )
+    parser.add_argument(
+        "--profile",
+        type=str,
+        choices=sorted(GENERATION_PROFILES),
+        default="default",
+        help="Generation profile for every model. Default: model defaults"
+    )
+    parser.add_argument(
+        "--engine",
+        type=str,
+        choices=["threads", "async"],
+        default="async",
+        help="Execution engine (see run_inference.py). Default: async"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=20,
+        help="Thread pool size for the threads engine. Default: 20"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=20,
+        help="Max in-flight requests per model. Default: 20"
+    )
+    parser.add_argument(
+        "--no-context-cache",
+        action="store_true",
+        help="Send the video with every prompt instead of sharing Vertex cached content"
+    )
+    parser.add_argument(
+        "--context-ttl",
+        type=int,
+        default=1800,
+        help="Lifetime in seconds of each cached video context if it isn't deleted first. Default: 1800"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Don't read or write the local response cache"
+    )
+    parser.add_argument(
+        "--resume",
+        type=str,
+        metavar="RUN_DIR",
+        help="Resume an interrupted sweep; models and prompts are read from its run_config.json"
+    )
+    args = parser.parse_args()
+    
+    if args.resume:
+        run_dir = Path(args.resume)
+        config_path = run_dir / RUN_CONFIG_FILE
+        if not config_path.exists() or not (run_dir / MANIFEST_FILE).exists():
+            print(f"ERROR: {run_dir} has no {RUN_CONFIG_FILE} / {MANIFEST_FILE} to resume from")
+            sys.exit(1)
+        with open(config_path) as f:
+            sweep = json.load(f).get("sweep")
+        if not sweep:
+            print(f"ERROR: {run_dir} is not a sweep run (use run_inference.py --resume)")
+            sys.exit(1)
+        models, prompts, profile = sweep["models"], sweep["prompts"], sweep["profile"]
+        gcs_path = sweep["gcs_path"]
+    else:
+        models = parse_models(args.model)
+        prompts = list(dict.fromkeys(args.prompts))
+        profile = args.profile
+        gcs_path = args.gcs_path
+        if not models:
+            parser.error("at least one --model is required")
+        run_dir = create_run_dir()
+    
+    print("=" * 80)
+    print(f"Prompt x Model Sweep: {len(models)} models x {len(prompts)} prompts")
+    print("=" * 80)
+    for model_name, model_id in models.items():
+        print(f"  {model_name}: {model_id}")
+    print(f"  Prompts: {', '.join(prompts)}")
+    print(f"  Profile: {profile} {GENERATION_PROFILES[profile]}")
+    print()
+    
+    manifest = TaskManifest(run_dir)
+    if args.resume:
+        print(f"Resuming: {run_dir}")
+        for entry in manifest.tasks.values():
+            VIDEO_METADATA.setdefault(entry["video_uri"], entry.get("video", {}))
+        print(f"Manifest: {manifest.counts()}")
+    else:
+        video_uris = list_videos_from_gcs(gcs_path)
+        if not video_uris:
+            print("ERROR: No videos found!")
+            sys.exit(1)
+        write_json(run_dir / RUN_CONFIG_FILE, {
+            "sweep": {
+                "gcs_path": gcs_path,
+                "models": models,
+                "prompts": prompts,
+                "prompt_sha256": {prompt: prompt_sha256(get_prompt(prompt)) for prompt in prompts},
+                "profile": profile,
+            },
+            "created": datetime.now().isoformat(),
+        })
+        # Cells of one video and model are added together so they run back to back
+        for video_uri in video_uris:
+            for model_name, model_id in models.items():
+                for prompt_type in prompts:
+                    manifest.add_task(video_uri, model_name, model_id, prompt_type, VIDEO_METADATA.get(video_uri))
+    
+    pending_keys = manifest.unfinished()
+    if not pending_keys:
+        print("Nothing to do: every cell in the manifest is done.")
+        return
+    
+    print()
+    print("-" * 80)
+    print("Initializing models...")
+    print("-" * 80)
+    loaded = {name: load_model(model_id, name) for name, model_id in models.items()}
+    
+    tasks = []
+    for key in pending_keys:
+        entry = manifest.tasks[key]
+        video_name = video_name_from_uri(entry["video_uri"])
+        tasks.append({
+            "video_uri": entry["video_uri"],
+            "model": loaded[entry["model_name"]],
+            "model_name": entry["model_name"],
+            "model_id": entry["model_id"],
+            "prompt": get_prompt(entry["prompt_type"]),
+            "prompt_type": entry["prompt_type"],
+            "profile": profile,
+            "generation_config": dict(GENERATION_PROFILES[profile]),
+            "output_name": f"{video_name}_{entry['model_name']}_{entry['prompt_type']}",
+            "manifest_key": key,
+        })
+    tasks = schedule_tasks(tasks)
+    
+    contexts = None if args.no_context_cache else VideoContextCache(tasks, ttl_seconds=args.context_ttl)
+    cache = None if args.no_cache else ResponseCache(CACHE_DIR, CACHE_MAX_MB * 1_000_000)
+    
+    print()
+    print("-" * 80)
+    shared = sum(1 for task in tasks if contexts and contexts.shares(task))
+    print(f"Running {len(tasks)} of {len(manifest.tasks)} cells ({args.engine} engine, {shared} on shared video context)...")
+    print("-" * 80)
+    
+    run_start = time.perf_counter()
+    results, limiters = asyncio.run(run_tasks(
+        tasks, run_dir, args.engine, args.workers,
+        {name: args.concurrency for name in models},
+        retry_policy=DEFAULT_RETRY_POLICY, manifest=manifest, cache=cache, contexts=contexts,
+    ))
+    wall_time = time.perf_counter() - run_start
+    
+    write_json(run_dir / "sweep_summary.json", {
+        "models": models,
+        "prompts": prompts,
+        "profile": profile,
+        "wall_time_s": round(wall_time, 3),
+        "cells": [
+            {
+                "video": r["video_name"],
+                "model": r["model_name"],
+                "prompt": r["prompt_type"],
+                "output": f"json/{r['output']}",
+                "segments": r["segments"],
+                "latency_s": round(r["latency"], 3),
+                "attempts": r["attempts"],
+                "cached": r["cached"],
+                "error": r["error"],
+            }
+            for r in results
+        ],
+    })
+    
+    print_sweep_grid(results, list(models), prompts)
+    print_engine_report(results, args.engine, wall_time, limiters, cache)
+    if contexts:
+        print(
+            f"  Video context cache: {contexts.created} created "
+            f"({contexts.create_latency:.1f}s total), {contexts.reused} reuses, {contexts.failed} failed"
+        )
+    print_metrics_report(run_dir)
+    
+    print()
+    print("=" * 80)
+    print("✓ Sweep complete!")
+    print(f"  Output directory: {run_dir}")
+    print(f"  Cell timings: {run_dir / 'sweep_summary.json'}")
+    print(f"  Manifest: {manifest.counts()}")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,17 +9,39 @@ import pandas as pd
 import json
 import random
 import os
+import time
+import uuid
 import tempfile
+import threading
 from pathlib import Path
 from datetime import datetime
+from google.api_core.exceptions import NotFound, PreconditionFailed
 from google.cloud.storage import Client
 from google.oauth2 import service_account
 from io import StringIO
+from concurrent.futures import ThreadPoolExecutor
 
 # Configuration
 GCS_BUCKET = "buildai-dataset"
 GCS_INFERENCE_PATH = "inference_runs"
-GCS_SCORES_PATH = "scores/scores.csv"
+RUN_INDEX_TTL = 300  # Seconds a run's video index is shared by sessions before it's re-read
+GCS_SCORES_PATH = "scores/scores.csv"  # Single CSV of all scores (SCORES_WRITE_MODE=csv, and older scores)
+GCS_SUBMISSIONS_PATH = "scores/submissions"  # One immutable JSON object per submitted video
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi')
+
+# "submissions" (default): one object per submission; "csv": append to scores.csv
+SCORES_WRITE_MODE = os.getenv("SCORES_WRITE_MODE", "submissions")
+CSV_WRITE_ATTEMPTS = 10
+
+# Submissions are journaled locally, then written to GCS in batches by a background thread.
+# The journal must be on a disk that survives restarts, or unsaved scores are lost with it
+SCORES_JOURNAL = Path(os.getenv("SCORES_JOURNAL", "./cache/scores_journal.jsonl"))
+GROUP_COMMIT_INTERVAL = 0.3
+
+SCORE_COLUMNS = [
+    'timestamp', 'rater_id', 'video', 'color', 'model', 'mode',
+    'coverage', 'order', 'verb', 'specificity', 'hallucination', 'score', 'notes'
+]
 
 # Scoring rubric (5 categories)
 RUBRIC = [
@@ -73,6 +95,12 @@ def get_storage_client():
     return get_gcs_client()
 
 
+@st.cache_resource
+def get_write_stats():
+    """Process-wide counters of scores.csv writes and generation conflicts."""
+    return {"lock": threading.Lock(), "writes": 0, "conflicts": 0}
+
+
 def init_session():
     """Initialize session state variables."""
     if 'selected_run' not in st.session_state:
@@ -107,27 +135,41 @@ def list_available_runs():
     return sorted(runs, reverse=True)
 
 
-def get_videos_from_gcs(run_name, rater_id):
-    """Get list of videos with their model outputs from GCS."""
+@st.cache_data(ttl=RUN_INDEX_TTL, show_spinner=False)
+def load_run_index(run_name):
+    """All scorable videos of a run (names, model pairs, step texts, colors).
+    
+    Read from the run's index.json, written by upload_inference_to_gcs.py,
+    and shared by all sessions, so a new session costs one cache lookup.
+    None for runs uploaded before the index existed.
+    """
     storage_client = get_storage_client()
     bucket = storage_client.bucket(GCS_BUCKET)
     
-    json_prefix = f"{GCS_INFERENCE_PATH}/{run_name}/json/"
+    index_blob = bucket.blob(f"{GCS_INFERENCE_PATH}/{run_name}/index.json")
+    if index_blob.exists():
+        return json.loads(index_blob.download_as_text())["videos"]
+    return None
+
+
+@st.cache_data(ttl=RUN_INDEX_TTL, show_spinner=False)
+def list_run_pairs(run_name):
+    """Videos with two model outputs in a run's json/ (names only) and the run's color mapping."""
+    storage_client = get_storage_client()
+    bucket = storage_client.bucket(GCS_BUCKET)
     
-    # List all JSON files
-    blobs = list(bucket.list_blobs(prefix=json_prefix))
+    json_prefix = f"{GCS_INFERENCE_PATH}/{run_name}/json/"
     
     # Group JSON files by video name
     video_dict = {}
     color_map = {}
     
-    for blob in blobs:
+    for blob in bucket.list_blobs(prefix=json_prefix, fields="items(name),nextPageToken"):
         filename = blob.name.split('/')[-1]
         
         if filename == "color_mapping.json":
             # Load color mapping
-            content = blob.download_as_text()
-            color_map = json.loads(content)
+            color_map = json.loads(blob.download_as_text())
             continue
         
         if not filename.endswith('.json'):
@@ -136,36 +178,95 @@ def get_videos_from_gcs(run_name, rater_id):
         parts = filename.rsplit('.', 1)[0].rsplit('_', 1)
         if len(parts) == 2:
             video_name, model_name = parts
-            if video_name not in video_dict:
-                video_dict[video_name] = {}
-            
-            # Download and parse JSON
-            content = blob.download_as_text()
-            data = json.loads(content)
-            
-            if 'format' in data and data['format'] == 'numbered_list':
-                video_dict[video_name][model_name] = data['steps']
+            video_dict.setdefault(video_name, []).append(model_name)
     
-    # Build video list
-    videos = []
-    for video_name, models in video_dict.items():
-        if len(models) == 2:
-            model_names = list(models.keys())
-            video_colors = color_map.get(video_name, {})
-            videos.append({
-                'name': video_name,
-                'model1': model_names[0],
-                'model2': model_names[1],
-                'text1': models[model_names[0]],
-                'text2': models[model_names[1]],
-                'color1': video_colors.get(model_names[0], 'yellow'),
-                'color2': video_colors.get(model_names[1], 'red')
-            })
-    
-    # Randomize and sample 3 videos per rater
+    pairs = {video_name: models for video_name, models in video_dict.items() if len(models) == 2}
+    return pairs, color_map
+
+
+def fetch_video_outputs(run_name, video_name, model_names, color_map):
+    """Download one video's two model outputs; None unless both exist and are numbered lists."""
+    storage_client = get_storage_client()
+    bucket = storage_client.bucket(GCS_BUCKET)
+    
+    texts = {}
+    for model_name in model_names:
+        blob = bucket.blob(f"{GCS_INFERENCE_PATH}/{run_name}/json/{video_name}_{model_name}.json")
+        try:
+            data = json.loads(blob.download_as_text())
+        except NotFound:
+            # Removed since the run was listed; skip this video
+            return None
+        if data.get('format') != 'numbered_list':
+            return None
+        texts[model_name] = data['steps']
+    
+    video_colors = color_map.get(video_name, {})
+    return {
+        'name': video_name,
+        'model1': model_names[0],
+        'model2': model_names[1],
+        'text1': texts[model_names[0]],
+        'text2': texts[model_names[1]],
+        'color1': video_colors.get(model_names[0], 'yellow'),
+        'color2': video_colors.get(model_names[1], 'red')
+    }
+
+
+def get_videos_from_gcs(run_name, rater_id):
+    """Get list of videos with their model outputs from GCS."""
     random.seed(rater_id)
-    random.shuffle(videos)
-    return videos[:3]  # Only return 3 random videos
+    
+    index = load_run_index(run_name)
+    if index is not None:
+        # Randomize and sample 3 videos per rater
+        videos = list(index)
+        random.shuffle(videos)
+        return videos[:3]  # Only return 3 random videos
+    
+    # No index: sample video names first, then download only the sampled
+    # videos' outputs (concurrently). Later names stand in for any sampled
+    # video whose outputs turn out not to be scorable.
+    pairs, color_map = list_run_pairs(run_name)
+    names = list(pairs)
+    random.shuffle(names)
+    
+    videos = []
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        while len(videos) < 3 and names:
+            sample, names = names[:3 - len(videos)], names[3 - len(videos):]
+            fetched = executor.map(lambda name: fetch_video_outputs(run_name, name, pairs[name], color_map), sample)
+            videos.extend(video for video in fetched if video)
+    return videos
+
+
+@st.cache_resource
+def get_video_prefetcher():
+    """Process-wide pool that downloads the next video while a rater scores the current one."""
+    return {"executor": ThreadPoolExecutor(max_workers=4), "futures": {}, "lock": threading.Lock()}
+
+
+def prefetch_video(video_name, gcs_path):
+    """Start downloading a video in the background (no-op if already started)."""
+    prefetcher = get_video_prefetcher()
+    key = (gcs_path, video_name)
+    with prefetcher["lock"]:
+        if key not in prefetcher["futures"]:
+            prefetcher["futures"][key] = prefetcher["executor"].submit(download_video, video_name, gcs_path)
+
+
+def load_video(video_name, gcs_path):
+    """Local path of a video, waiting for its prefetch if one was started."""
+    prefetcher = get_video_prefetcher()
+    with prefetcher["lock"]:
+        # A prefetch is used once; later loads find the downloaded file in download_video()
+        future = prefetcher["futures"].pop((gcs_path, video_name), None)
+    if future:
+        video_path = future.result()
+        # The temp file may have been cleaned up since the prefetch finished
+        if video_path and video_path.exists():
+            return video_path
+    return download_video(video_name, gcs_path)
 
 
 def download_video(video_name, gcs_path):
@@ -186,50 +287,43 @@ def download_video(video_name, gcs_path):
     if prefix and not prefix.endswith('/'):
         prefix += '/'
     
-    # Find and download video
     storage_client = get_storage_client()
     bucket = storage_client.bucket(bucket_name)
-    blobs = list(bucket.list_blobs(prefix=prefix))
     
-    for blob in blobs:
+    # The blob name follows from the video name, so fetch it directly
+    for ext in VIDEO_EXTENSIONS:
+        try:
+            download_blob(bucket.blob(f"{prefix}{video_name}{ext}"), local_path)
+            return local_path
+        except NotFound:
+            continue
+    
+    # Only a name that differs in case needs the prefix listed
+    for blob in bucket.list_blobs(prefix=prefix, fields="items(name),nextPageToken"):
         filename = blob.name.split('/')[-1]
         name_no_ext = filename.rsplit('.', 1)[0].lower()
-        if name_no_ext == video_name.lower() and filename.lower().endswith(('.mp4', '.mov', '.avi')):
-            blob.download_to_filename(str(local_path))
+        if name_no_ext == video_name.lower() and filename.lower().endswith(VIDEO_EXTENSIONS):
+            download_blob(bucket.blob(blob.name), local_path)
             return local_path
     
     return None
 
 
-def load_scores_from_gcs():
-    """Load existing scores from GCS."""
-    storage_client = get_storage_client()
-    bucket = storage_client.bucket(GCS_BUCKET)
-    blob = bucket.blob(GCS_SCORES_PATH)
-    
+def download_blob(blob, local_path):
+    """Download a blob under a temporary name so a partial file is never served."""
+    tmp_path = local_path.with_suffix(f".{uuid.uuid4().hex[:8]}.part")
     try:
-        content = blob.download_as_text()
-        return pd.read_csv(StringIO(content))
-    except:
-        # File doesn't exist yet, return empty DataFrame
-        return pd.DataFrame(columns=[
-            'timestamp', 'rater_id', 'video', 'color', 'model', 'mode',
-            'coverage', 'order', 'verb', 'specificity', 'hallucination', 'score', 'notes'
-        ])
-
-
-def save_score_to_gcs(video_name, rater_id, color, model, deductions, score, notes, mode='detailed'):
-    """Save a single score to GCS CSV."""
-    storage_client = get_storage_client()
-    bucket = storage_client.bucket(GCS_BUCKET)
-    blob = bucket.blob(GCS_SCORES_PATH)
-    
-    # Load existing scores
-    existing_df = load_scores_from_gcs()
-    
-    # Create new row
+        blob.download_to_filename(str(tmp_path))
+    except NotFound:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    os.replace(tmp_path, local_path)
+
+
+def score_row(video_name, rater_id, color, model, deductions, score, notes, mode='detailed'):
+    """Build one scores row (one model's score for a video)."""
     if mode == 'binary':
-        data = {
+        return {
             'timestamp': datetime.now().isoformat(),
             'rater_id': rater_id,
             'video': video_name,
@@ -244,29 +338,209 @@ def save_score_to_gcs(video_name, rater_id, color, model, deductions, score, not
             'score': '',
             'notes': notes
         }
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'rater_id': rater_id,
+        'video': video_name,
+        'color': color,
+        'model': model,
+        'mode': 'detailed',
+        'coverage': deductions.get('coverage', 0),
+        'order': deductions.get('order', 0),
+        'verb': deductions.get('verb', 0),
+        'specificity': deductions.get('specificity', 0),
+        'hallucination': deductions.get('hallucination', 0),
+        'score': score,
+        'notes': notes
+    }
+
+
+def save_submission_to_gcs(rows, name=None):
+    """Save score rows to GCS as a new object.
+    
+    Every submission (or batch of them) gets its own uniquely named object,
+    created with if_generation_match=0 so it can never overwrite another. A
+    write is one small upload regardless of how many scores exist, and
+    concurrent raters can't lose each other's rows.
+    """
+    storage_client = get_storage_client()
+    bucket = storage_client.bucket(GCS_BUCKET)
+    name = name or f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{uuid.uuid4().hex[:8]}"
+    blob = bucket.blob(f"{GCS_SUBMISSIONS_PATH}/{name}.json")
+    blob.upload_from_string(json.dumps(rows), content_type='application/json', if_generation_match=0)
+
+
+def append_scores_to_csv(rows, batch_id=None):
+    """Append score rows to the single scores.csv with optimistic concurrency.
+    
+    The file is read together with its generation and written back with
+    if_generation_match, so the upload only succeeds if nobody else wrote in
+    between. On a conflict the file is re-read and the rows appended again.
+    Writes and conflicts are counted process-wide and logged as a conflict rate.
+    
+    With a batch_id the rows are tagged with it in a 'batch' column, and
+    nothing is written if the CSV already has that batch, so a batch re-sent
+    after a restart isn't appended twice.
+    """
+    storage_client = get_storage_client()
+    bucket = storage_client.bucket(GCS_BUCKET)
+    stats = get_write_stats()
+    new_rows = pd.DataFrame(rows, columns=SCORE_COLUMNS)
+    if batch_id:
+        new_rows['batch'] = batch_id
+    
+    for attempt in range(CSV_WRITE_ATTEMPTS):
+        try:
+            blob = bucket.get_blob(GCS_SCORES_PATH)
+            text = blob.download_as_text(if_generation_match=blob.generation) if blob else ''
+            if not text.strip():
+                # if_generation_match=0: only create the file if it still doesn't exist
+                generation, content = blob.generation if blob else 0, new_rows.to_csv(index=False)
+            else:
+                # Read as text so existing rows are written back unchanged; older
+                # columns are kept and new ones (e.g. 'batch') added to the header
+                existing = pd.read_csv(StringIO(text), dtype=str, keep_default_na=False)
+                if batch_id and 'batch' in existing.columns and (existing['batch'] == batch_id).any():
+                    print(f"[scores] batch {batch_id} is already in {GCS_SCORES_PATH}")
+                    return
+                generation, content = blob.generation, pd.concat([existing, new_rows.astype(object)], ignore_index=True).to_csv(index=False)
+            bucket.blob(GCS_SCORES_PATH).upload_from_string(
+                content, content_type='text/csv', if_generation_match=generation
+            )
+            break
+        except PreconditionFailed:
+            with stats["lock"]:
+                stats["conflicts"] += 1
+            time.sleep(random.uniform(0, min(2.0, 0.1 * 2 ** attempt)))
     else:
-        data = {
-            'timestamp': datetime.now().isoformat(),
-            'rater_id': rater_id,
-            'video': video_name,
-            'color': color,
-            'model': model,
-            'mode': 'detailed',
-            'coverage': deductions.get('coverage', 0),
-            'order': deductions.get('order', 0),
-            'verb': deductions.get('verb', 0),
-            'specificity': deductions.get('specificity', 0),
-            'hallucination': deductions.get('hallucination', 0),
-            'score': score,
-            'notes': notes
-        }
-    
-    # Append to DataFrame
-    new_df = pd.concat([existing_df, pd.DataFrame([data])], ignore_index=True)
+        raise RuntimeError(f"Couldn't save scores after {CSV_WRITE_ATTEMPTS} conflicting writes")
     
-    # Upload to GCS
-    csv_string = new_df.to_csv(index=False)
-    blob.upload_from_string(csv_string, content_type='text/csv')
+    with stats["lock"]:
+        stats["writes"] += 1
+        rate = stats["conflicts"] / (stats["writes"] + stats["conflicts"])
+        print(f"[scores] csv write after {attempt + 1} attempts; "
+              f"{stats['conflicts']} conflicts / {stats['writes']} writes ({rate:.1%} conflict rate)")
+
+
+def save_scores(rows, name=None):
+    """Save score rows with the configured SCORES_WRITE_MODE."""
+    if SCORES_WRITE_MODE == "csv":
+        append_scores_to_csv(rows, batch_id=name)
+    else:
+        save_submission_to_gcs(rows, name=name)
+
+
+class ScoreWriter:
+    """Process-wide write-behind queue for score submissions.
+    
+    submit() appends the rows to a local journal (fsynced) and returns, so the
+    rater moves on without waiting for GCS. A background thread collects the
+    submissions of all sessions every GROUP_COMMIT_INTERVAL seconds and saves
+    them with one GCS write. Each batch is journaled before it is written and
+    marked committed after, so after a restart unwritten submissions are
+    written again, and a batch is re-sent under the same id: the same object
+    name (which if_generation_match=0 turns into a no-op if it had already
+    landed), or in csv mode the same 'batch' value, which is skipped if the
+    CSV already has it.
+    """
+    
+    def __init__(self, journal_path: Path, interval: float = GROUP_COMMIT_INTERVAL):
+        self.journal_path = journal_path
+        self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.pending = []  # (submission id, rows) not yet in a batch
+        self.batches = {}  # batch id -> [(submission id, rows)] not yet committed
+        self.failures = 0
+        self._replay()
+        self.thread = threading.Thread(target=self._run, name="score-writer", daemon=True)
+        self.thread.start()
+    
+    def _append(self, record):
+        with open(self.journal_path, 'a') as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+    
+    def _replay(self):
+        """Recover submissions and batches a previous process didn't commit."""
+        if not self.journal_path.exists():
+            return
+        submissions, batches = {}, {}
+        with open(self.journal_path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Torn final line from a crash mid-write
+                    continue
+                if record["type"] == "submit":
+                    submissions[record["id"]] = record["rows"]
+                elif record["type"] == "batch":
+                    batches[record["id"]] = record["submissions"]
+                elif record["type"] == "commit":
+                    for submission_id in batches.pop(record["batch"], []):
+                        submissions.pop(submission_id, None)
+        batched = set(i for ids in batches.values() for i in ids)
+        self.batches = {bid: [(i, submissions[i]) for i in ids if i in submissions] for bid, ids in batches.items()}
+        self.pending = [(i, rows) for i, rows in submissions.items() if i not in batched]
+        
+        # Rewrite the journal with only what is still outstanding
+        tmp_path = self.journal_path.with_suffix(".tmp")
+        with open(tmp_path, 'w') as f:
+            for bid, subs in self.batches.items():
+                for i, rows in subs:
+                    f.write(json.dumps({"type": "submit", "id": i, "rows": rows}) + "\n")
+                f.write(json.dumps({"type": "batch", "id": bid, "submissions": [i for i, _ in subs]}) + "\n")
+            for i, rows in self.pending:
+                f.write(json.dumps({"type": "submit", "id": i, "rows": rows}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.journal_path)
+        if self.pending or self.batches:
+            print(f"[scores] recovered {len(self.pending) + sum(len(s) for s in self.batches.values())} unsaved submissions from {self.journal_path}")
+    
+    def submit(self, rows):
+        """Queue a submission's rows; durable once this returns."""
+        submission_id = uuid.uuid4().hex
+        with self.lock:
+            self._append({"type": "submit", "id": submission_id, "rows": rows})
+            self.pending.append((submission_id, rows))
+    
+    def _run(self):
+        while True:
+            # Back off while GCS writes are failing
+            time.sleep(min(30.0, self.interval * 2 ** self.failures))
+            with self.lock:
+                if self.pending:
+                    bid = f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{uuid.uuid4().hex[:8]}"
+                    self._append({"type": "batch", "id": bid, "submissions": [i for i, _ in self.pending]})
+                    self.batches[bid] = self.pending
+                    self.pending = []
+                batches = list(self.batches.items())
+            
+            for bid, subs in batches:
+                try:
+                    save_scores([row for _, rows in subs for row in rows], name=bid)
+                except PreconditionFailed:
+                    pass  # Re-sent batch that had already been written
+                except Exception as e:
+                    print(f"[scores] batch {bid} ({len(subs)} submissions) not saved, retrying: {e}")
+                    self.failures += 1
+                    break
+                self.failures = 0
+                with self.lock:
+                    del self.batches[bid]
+                    self._append({"type": "commit", "batch": bid})
+                    if not self.pending and not self.batches:
+                        # Everything is in GCS; start the journal afresh
+                        open(self.journal_path, 'w').close()
+
+
+@st.cache_resource
+def get_score_writer():
+    """The process-wide ScoreWriter shared by all sessions."""
+    return ScoreWriter(SCORES_JOURNAL)
 
 
 def format_steps(text):
@@ -468,7 +742,11 @@ def main():
     
     # Download video
     with st.spinner("Loading video..."):
-        video_path = download_video(video['name'], st.session_state.gcs_video_path)
+        video_path = load_video(video['name'], st.session_state.gcs_video_path)
+    
+    # Fetch the next video in the background while this one is scored
+    if idx + 1 < len(videos):
+        prefetch_video(videos[idx + 1]['name'], st.session_state.gcs_video_path)
     
     if not video_path:
         st.error("Could not load video.")
@@ -522,11 +800,13 @@ def main():
             # Use empty notes since we removed the field
             notes = ""
             
-            with st.spinner("Saving..."):
-                save_score_to_gcs(video['name'], st.session_state.rater_id, color1, 
-                          video['model1'], {}, score1, notes, mode='binary')
-                save_score_to_gcs(video['name'], st.session_state.rater_id, color2,
-                          video['model2'], {}, score2, notes, mode='binary')
+            # Saved to GCS in the background (see ScoreWriter)
+            get_score_writer().submit([
+                score_row(video['name'], st.session_state.rater_id, color1,
+                          video['model1'], {}, score1, notes, mode='binary'),
+                score_row(video['name'], st.session_state.rater_id, color2,
+                          video['model2'], {}, score2, notes, mode='binary'),
+            ])
             
             st.session_state.current_idx += 1
             st.rerun()
@@ -576,11 +856,13 @@ def main():
         
         # Submit
         if st.button("✓ Submit & Next", type="primary", use_container_width=True):
-            with st.spinner("Saving..."):
-                save_score_to_gcs(video['name'], st.session_state.rater_id, color1, 
-                          video['model1'], deductions1, score1, notes, mode='detailed')
-                save_score_to_gcs(video['name'], st.session_state.rater_id, color2,
-                          video['model2'], deductions2, score2, notes, mode='detailed')
+            # Saved to GCS in the background (see ScoreWriter)
+            get_score_writer().submit([
+                score_row(video['name'], st.session_state.rater_id, color1,
+                          video['model1'], deductions1, score1, notes, mode='detailed'),
+                score_row(video['name'], st.session_state.rater_id, color2,
+                          video['model2'], deductions2, score2, notes, mode='detailed'),
+            ])
             
             st.session_state.current_idx += 1
             st.rerun()
@@ -6,7 +6,10 @@ Upload local inference outputs to GCS for cloud scoring app access.
 import os
 import sys
 import json
+import random
 from pathlib import Path
+from datetime import datetime
+from typing import List, Dict, Any
 from google.cloud.storage import Client
 from dotenv import load_dotenv
 
@@ -17,6 +20,97 @@ GCS_BUCKET = "buildai-dataset"
 GCS_BASE_PATH = "inference_runs"
 
 
+def build_run_index(json_dir: Path, color_map: Dict[str, Dict[str, str]]) -> Dict[str, Any]:
+    """Index of a run's scorable videos for the scoring app.
+    
+    Holds what a rater session needs for every video with both models'
+    numbered-list outputs (model names, step texts, colors), in the same order
+    the app would find them by listing json/.
+    """
+    video_dict = {}
+    for json_file in sorted(json_dir.glob("*.json")):
+        parts = json_file.stem.rsplit('_', 1)
+        if json_file.name == "color_mapping.json" or len(parts) != 2:
+            continue
+        video_name, model_name = parts
+        video_dict.setdefault(video_name, {})
+        with open(json_file) as f:
+            data = json.load(f)
+        if data.get('format') == 'numbered_list':
+            video_dict[video_name][model_name] = data['steps']
+    
+    videos = []
+    for video_name, models in video_dict.items():
+        if len(models) == 2:
+            model_names = list(models.keys())
+            video_colors = color_map.get(video_name, {})
+            videos.append({
+                'name': video_name,
+                'model1': model_names[0],
+                'model2': model_names[1],
+                'text1': models[model_names[0]],
+                'text2': models[model_names[1]],
+                'color1': video_colors.get(model_names[0], 'yellow'),
+                'color2': video_colors.get(model_names[1], 'red')
+            })
+    return {"run": json_dir.parent.name, "created": datetime.now().isoformat(), "videos": videos}
+
+
+def upload_run_index(bucket, local_run_dir: Path, color_map: Dict[str, Dict[str, str]] = None):
+    """Write the run's index.json next to its json/ folder in GCS."""
+    gcs_path = f"{GCS_BASE_PATH}/{local_run_dir.name}"
+    if color_map is None:
+        local_mapping = local_run_dir / "json" / "color_mapping.json"
+        mapping_blob = bucket.blob(f"{gcs_path}/json/color_mapping.json")
+        if local_mapping.exists():
+            with open(local_mapping) as f:
+                color_map = json.load(f)
+        else:
+            color_map = json.loads(mapping_blob.download_as_text()) if mapping_blob.exists() else {}
+    index = build_run_index(local_run_dir / "json", color_map)
+    bucket.blob(f"{gcs_path}/index.json").upload_from_string(json.dumps(index), content_type="application/json")
+    return index
+
+
+def upload_outputs(local_run_dir: Path, json_files: List[Path]):
+    """Upload some of a run's output JSONs, e.g. the new ones from a --watch round.
+    
+    Videos that now have both models' outputs get a random red/yellow color
+    assignment added to the run's color_mapping.json, so outputs pushed
+    incrementally are still blinded in the scoring app.
+    """
+    run_name = local_run_dir.name
+    gcs_path = f"{GCS_BASE_PATH}/{run_name}"
+    storage_client = Client(project=PROJECT_ID)
+    bucket = storage_client.bucket(GCS_BUCKET)
+    
+    for json_file in json_files:
+        bucket.blob(f"{gcs_path}/json/{json_file.name}").upload_from_filename(str(json_file))
+    
+    mapping_blob = bucket.blob(f"{gcs_path}/json/color_mapping.json")
+    color_map = json.loads(mapping_blob.download_as_text()) if mapping_blob.exists() else {}
+    video_models = {}
+    for json_file in sorted((local_run_dir / "json").glob("*.json")):
+        parts = json_file.stem.rsplit('_', 1)
+        if len(parts) == 2:
+            video_models.setdefault(parts[0], []).append(parts[1])
+    added = 0
+    for video_name, models in video_models.items():
+        if len(models) == 2 and video_name not in color_map:
+            colors = ["red", "yellow"]
+            random.shuffle(colors)
+            color_map[video_name] = {models[0]: colors[0], models[1]: colors[1]}
+            added += 1
+    if added:
+        mapping_blob.upload_from_string(json.dumps(color_map, indent=2), content_type="application/json")
+    index = upload_run_index(bucket, local_run_dir, color_map)
+    
+    print(
+        f"  ✓ Pushed {len(json_files)} outputs to gs://{GCS_BUCKET}/{gcs_path}/json/ "
+        f"({added} new color assignments, {len(index['videos'])} videos in index)"
+    )
+
+
 def upload_run_to_gcs(local_run_dir: Path):
     """Upload inference run directory to GCS."""
     if not local_run_dir.exists():
@@ -47,6 +141,9 @@ def upload_run_to_gcs(local_run_dir: Path):
         blob.upload_from_filename(str(json_file))
         print(f"  ✓ Uploaded {json_file.name}")
     
+    index = upload_run_index(bucket, local_run_dir)
+    print(f"  ✓ Uploaded index.json ({len(index['videos'])} scorable videos)")
+    
     print(f"\n✓ Upload complete!")
     print(f"  GCS path: gs://{GCS_BUCKET}/{gcs_path}/")
     print(f"  Run name for scoring app: {run_name}")